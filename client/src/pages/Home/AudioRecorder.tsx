@@ -16,13 +16,14 @@ const STATUS_LABELS: Record<string, string> = {
 // Define polling interval in milliseconds
 const POLLING_INTERVAL = 3000;
 
-interface PollingItem {
-  id: number;
+interface PipelineStatus {
   status: string;
+  stages: string[];
+  progress: number;
   completed: boolean;
   error: string | null;
   success: boolean | null;
-  created_at: string;
+  started_at: string;
   updated_at: string;
 }
 
@@ -45,6 +46,7 @@ interface SoapItem {
 interface Visit {
   id: number;
   audio_file: string | null;
+  audio_url: string | null;
   transcript_text: string | null;
   transcript_json: Transcript | null;
   draft_soap_note: { subjective: SoapItem; objective: SoapItem; assessment: SoapItem; plan: SoapItem } | null;
@@ -56,7 +58,7 @@ interface Visit {
 
 interface PollingResponse {
   visit: Visit;
-  pollings: PollingItem[];
+  status: PipelineStatus | null;
 }
 
 const SPEAKER_COLORS = [
@@ -90,7 +92,7 @@ const AudioRecorder: React.FC = () => {
 
   // Processing state
   const [isProcessing, setIsProcessing] = useState<boolean>(false);
-  const [pollingItems, setPollingItems] = useState<PollingItem[]>([]);
+  const [pipelineStatus, setPipelineStatus] = useState<PipelineStatus | null>(null);
   const [processingComplete, setProcessingComplete] = useState<boolean>(false);
   const [processingError, setProcessingError] = useState<boolean>(false);
   const [visit, setVisit] = useState<Visit | null>(null);
@@ -114,6 +116,7 @@ const AudioRecorder: React.FC = () => {
   const timerIntervalRef = useRef<number | null>(null);
   const pollingIntervalRef = useRef<number | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const audioPlayerRef = useRef<HTMLAudioElement>(null);
 
   const formatTime = (seconds: number): string => {
     const mins = Math.floor(seconds / 60);
@@ -133,7 +136,7 @@ const AudioRecorder: React.FC = () => {
       setError(null);
       setProcessingComplete(false);
       setProcessingError(false);
-      setPollingItems([]);
+      setPipelineStatus(null);
       setVisit(null);
 
       // First get a visit ID from the backend
@@ -268,13 +271,13 @@ const AudioRecorder: React.FC = () => {
         setVisit(visitData.visit);
         setSpeakerMapping(visitData.visit?.speaker_mapping || {});
 
-        // Update polling items
-        if (visitData.pollings) {
-          setPollingItems(visitData.pollings);
+        // Update pipeline status
+        if (visitData.status) {
+          setPipelineStatus(visitData.status);
 
           // Check if processing is complete or has error
-          const hasCompleted = visitData.pollings.some((item) => item.status === "completed");
-          const hasError = visitData.pollings.some((item) => item.status === "error");
+          const hasCompleted = visitData.status.status === "completed";
+          const hasError = visitData.status.status === "error";
 
           if (hasCompleted) {
             setProcessingComplete(true);
@@ -288,9 +291,8 @@ const AudioRecorder: React.FC = () => {
             pollingIntervalRef.current = null;
 
             // Get the error message
-            const errorItem = visitData.pollings.find((item) => item.status === "error");
-            if (errorItem && errorItem.error) {
-              setError(errorItem.error);
+            if (visitData.status.error) {
+              setError(visitData.status.error);
             } else {
               setError("An error occurred during processing.");
             }
@@ -362,7 +364,7 @@ const AudioRecorder: React.FC = () => {
       setError(null);
       setProcessingComplete(false);
       setProcessingError(false);
-      setPollingItems([]);
+      setPipelineStatus(null);
       setVisit(null);
 
       // First get a visit ID from the backend if we don't have one
@@ -472,27 +474,22 @@ const AudioRecorder: React.FC = () => {
     };
   }, []);
 
-  // Get unique statuses in order of creation
+  // Get the statuses reached by the current run, in order
   const getUniqueStatuses = (): string[] => {
-    if (!pollingItems || pollingItems.length === 0) return [];
-
-    const statuses = new Set<string>();
-
-    // Sort by created_at to ensure correct order
-    const sortedItems = [...pollingItems].sort((a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime());
-
-    sortedItems.forEach((item) => statuses.add(item.status));
-    return Array.from(statuses);
+    return pipelineStatus?.stages ?? [];
   };
 
   // Get the most recent status
   const getCurrentStatus = (): string => {
-    if (!pollingItems || pollingItems.length === 0) return "";
-
-    // Sort by created_at in descending order to get the most recent
-    const sortedItems = [...pollingItems].sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime());
+    return pipelineStatus?.status ?? "";
+  };
 
-    return sortedItems[0].status;
+  // Seek the visit's audio to a sentence; the server answers with a byte range
+  const playFrom = (seconds: number) => {
+    const player = audioPlayerRef.current;
+    if (!player) return;
+    player.currentTime = seconds;
+    player.play().catch((err) => console.error("Error playing audio:", err));
   };
 
   const getReferencedSentences = (references: { sentence_id: number; start: number; end: number }[]) => {
@@ -666,6 +663,9 @@ const AudioRecorder: React.FC = () => {
                 <div className="bg-base-100 shadow-sm flex-grow flex flex-col">
                   <div className="p-4 flex flex-col h-full overflow-hidden">
                     <h2 className="text-lg font-bold">Transcript</h2>
+                    {visit?.audio_url && (
+                      <audio ref={audioPlayerRef} controls preload="metadata" src={`${BACKEND_URL}${visit.audio_url}`} className="w-full my-2" />
+                    )}
 
                     {/* Scrollable transcript content */}
                     <div className="flex-grow !max-h-[75vh] border rounded-md p-4 overflow-y-scroll">
@@ -711,10 +711,15 @@ const AudioRecorder: React.FC = () => {
                                         </div>
                                       )}
                                     </div>
-                                    <span className="text-sm text-gray-500 ml-2">
+                                    <button
+                                      type="button"
+                                      onClick={() => playFrom(sentence.start)}
+                                      disabled={!visit.audio_url}
+                                      className="text-sm text-gray-500 ml-2 hover:underline"
+                                    >
                                       <FaClock className="inline mr-1" />
                                       {formatRecordingTime(sentence.start)} - {formatRecordingTime(sentence.end)}
-                                    </span>
+                                    </button>
                                   </div>
                                   <div className="prose max-w-none">
                                     <p className="text-sm">{sentence.sentence}</p>
@@ -814,9 +819,14 @@ const AudioRecorder: React.FC = () => {
                                     <div key={sentence.sentence_id} className="text-sm p-2 bg-base-200 rounded">
                                       <div className="flex justify-between items-center">
                                         <span className="font-medium">{sentence.speaker_name}: </span>
-                                        <span className="text-xs text-gray-500">
+                                        <button
+                                          type="button"
+                                          onClick={() => playFrom(sentence.start)}
+                                          disabled={!visit.audio_url}
+                                          className="text-xs text-gray-500 hover:underline"
+                                        >
                                           {formatRecordingTime(sentence.start)} - {formatRecordingTime(sentence.end)}
-                                        </span>
+                                        </button>
                                       </div>
                                       <p className="mt-1">{sentence.sentence}</p>
                                     </div>
@@ -859,9 +869,14 @@ const AudioRecorder: React.FC = () => {
                                     <div key={sentence.sentence_id} className="text-sm p-2 bg-base-200 rounded">
                                       <div className="flex justify-between items-center">
                                         <span className="font-medium">{sentence.speaker_name}: </span>
-                                        <span className="text-xs text-gray-500">
+                                        <button
+                                          type="button"
+                                          onClick={() => playFrom(sentence.start)}
+                                          disabled={!visit.audio_url}
+                                          className="text-xs text-gray-500 hover:underline"
+                                        >
                                           {formatRecordingTime(sentence.start)} - {formatRecordingTime(sentence.end)}
-                                        </span>
+                                        </button>
                                       </div>
                                       <p className="mt-1">{sentence.sentence}</p>
                                     </div>
@@ -904,9 +919,14 @@ const AudioRecorder: React.FC = () => {
                                     <div key={sentence.sentence_id} className="text-sm p-2 bg-base-200 rounded">
                                       <div className="flex justify-between items-center">
                                         <span className="font-medium">{sentence.speaker_name}: </span>
-                                        <span className="text-xs text-gray-500">
+                                        <button
+                                          type="button"
+                                          onClick={() => playFrom(sentence.start)}
+                                          disabled={!visit.audio_url}
+                                          className="text-xs text-gray-500 hover:underline"
+                                        >
                                           {formatRecordingTime(sentence.start)} - {formatRecordingTime(sentence.end)}
-                                        </span>
+                                        </button>
                                       </div>
                                       <p className="mt-1">{sentence.sentence}</p>
                                     </div>
@@ -949,9 +969,14 @@ const AudioRecorder: React.FC = () => {
                                     <div key={sentence.sentence_id} className="text-sm p-2 bg-base-200 rounded">
                                       <div className="flex justify-between items-center">
                                         <span className="font-medium">{sentence.speaker_name}: </span>
-                                        <span className="text-xs text-gray-500">
+                                        <button
+                                          type="button"
+                                          onClick={() => playFrom(sentence.start)}
+                                          disabled={!visit.audio_url}
+                                          className="text-xs text-gray-500 hover:underline"
+                                        >
                                           {formatRecordingTime(sentence.start)} - {formatRecordingTime(sentence.end)}
-                                        </span>
+                                        </button>
                                       </div>
                                       <p className="mt-1">{sentence.sentence}</p>
                                     </div>
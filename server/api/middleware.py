@@ -0,0 +1,89 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from transcribe.profiling import save_trace, start_profiler, stop_profiler
+
+
+def _wants_profile(request) -> bool:
+    return settings.PROFILING["requests"] and bool(
+        request.headers.get(settings.PROFILING["header"])
+    )
+
+
+def _visit_id(request) -> int | None:
+    match = getattr(request, "resolver_match", None)
+    visit_id = match.kwargs.get("visit_id") if match else None
+    return int(visit_id) if visit_id is not None and str(visit_id).isdigit() else None
+
+
+class ProfileMiddleware:
+    """
+    Profile a request with cProfile when it sends the `X-Profile` header and
+    request profiling is enabled, and return the stored trace's id in an
+    `X-Profile-Id` response header. Other requests only pay for the check.
+
+    cProfile follows a single thread: under ASGI it sees the event loop
+    thread, so async handlers are profiled but sync handlers run by
+    `sync_to_async` are not. Run under WSGI to profile those. Concurrent
+    async requests share that thread, so only one of them is profiled at a
+    time and the others are served without a trace.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _wants_profile(request):
+            return self.get_response(request)
+
+        profiler = start_profiler()
+        if profiler is None:
+            return self.get_response(request)
+        start_time = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_profiler(profiler)
+        trace = save_trace(
+            profiler,
+            "request",
+            f"{request.method} {request.path}",
+            time.perf_counter() - start_time,
+            _visit_id(request),
+        )
+        return self._add_trace_header(response, trace)
+
+    async def __acall__(self, request):
+        if not _wants_profile(request):
+            return await self.get_response(request)
+
+        profiler = start_profiler()
+        if profiler is None:
+            return await self.get_response(request)
+        start_time = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_profiler(profiler)
+        trace = await sync_to_async(save_trace)(
+            profiler,
+            "request",
+            f"{request.method} {request.path}",
+            time.perf_counter() - start_time,
+            _visit_id(request),
+        )
+        return self._add_trace_header(response, trace)
+
+    def _add_trace_header(self, response, trace):
+        if trace is not None:
+            response["X-Profile-Id"] = str(trace.id)
+        return response
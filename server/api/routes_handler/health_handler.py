@@ -1,8 +1,16 @@
 from ninja import Router
 
+from transcribe import scheduler
+
 router = Router()
 
 
 @router.get("/health/live")
 def health(request):
     return {"status": "ok"}
+
+
+@router.get("/health/scheduler")
+def scheduler_stats(request):
+    # Queue depth, in-flight calls and rejections per model backend
+    return {"models": scheduler.stats()}
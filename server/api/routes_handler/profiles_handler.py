@@ -0,0 +1,73 @@
+import logging
+
+from django.http import FileResponse, JsonResponse
+from ninja import Router
+
+from transcribe.models import ProfileTrace
+from transcribe.profiling import serialize_trace
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+MAX_LIMIT = 200
+
+
+def _forbidden(request):
+    # Traces expose code paths and timings: staff only, via the admin login
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff access required"}, status=403)
+    return None
+
+
+@router.get("/admin/profiles", tags=["Admin"])
+def list_profiles(
+    request, visit_id: int | None = None, kind: str | None = None, limit: int = 50
+):
+    """Most recent profile traces, optionally for one visit or of one kind."""
+    if forbidden := _forbidden(request):
+        return forbidden
+    if not 1 <= limit <= MAX_LIMIT:
+        return JsonResponse(
+            {"error": f"limit must be between 1 and {MAX_LIMIT}"}, status=400
+        )
+
+    traces = ProfileTrace.objects.order_by("-created_at", "-id")
+    if visit_id is not None:
+        traces = traces.filter(visit_id=visit_id)
+    if kind:
+        traces = traces.filter(kind=kind)
+    return JsonResponse(
+        {"profiles": [serialize_trace(trace) for trace in traces[:limit]]}
+    )
+
+
+@router.get("/admin/profiles/{trace_id}", tags=["Admin"])
+def get_profile(request, trace_id: int):
+    """A trace with its text summary, sorted by cumulative time."""
+    if forbidden := _forbidden(request):
+        return forbidden
+    try:
+        trace = ProfileTrace.objects.get(id=trace_id)
+        return JsonResponse(serialize_trace(trace, summary=True))
+    except ProfileTrace.DoesNotExist:
+        return JsonResponse({"error": "Profile not found"}, status=404)
+
+
+@router.get("/admin/profiles/{trace_id}/stats", tags=["Admin"])
+def download_profile(request, trace_id: int):
+    """The raw pstats dump, e.g. for `python -m pstats` or snakeviz."""
+    if forbidden := _forbidden(request):
+        return forbidden
+    try:
+        trace = ProfileTrace.objects.get(id=trace_id)
+        return FileResponse(
+            trace.stats_file.open("rb"),
+            as_attachment=True,
+            filename=f"profile-{trace.id}.prof",
+            content_type="application/octet-stream",
+        )
+    except ProfileTrace.DoesNotExist:
+        return JsonResponse({"error": "Profile not found"}, status=404)
+    except FileNotFoundError:
+        return JsonResponse({"error": "Profile stats file is missing"}, status=404)
@@ -0,0 +1,74 @@
+import logging
+from datetime import UTC, date, datetime, time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from ninja import Router
+
+from transcribe import scheduler, search_index
+from transcribe.scheduler import Priority, SchedulerRejected
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+MAX_PAGE_SIZE = 100
+
+
+def _search(*args, **kwargs):
+    # A clinician is waiting on the query embedding
+    with scheduler.priority(Priority.INTERACTIVE):
+        return search_index.search(*args, **kwargs)
+
+
+@router.get("/search", tags=["Search"])
+async def search(
+    request,
+    q: str,
+    visit_id: int | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    speaker: str | None = None,
+    kind: str | None = None,
+    page: int = 1,
+    page_size: int = 20,
+):
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        return JsonResponse(
+            {"error": f"page must be >= 1 and page_size between 1 and {MAX_PAGE_SIZE}"},
+            status=400,
+        )
+    if page * page_size > search_index.MAX_RESULTS:
+        return JsonResponse(
+            {
+                "error": f"Only the first {search_index.MAX_RESULTS} results can be "
+                "paged through, narrow the query with filters"
+            },
+            status=400,
+        )
+    if kind not in (None, "sentence", "soap"):
+        return JsonResponse({"error": "kind must be 'sentence' or 'soap'"}, status=400)
+
+    try:
+        # May wait in the model queue for up to a minute: off the event loop,
+        # and off the thread shared by sync views
+        results = await sync_to_async(_search, thread_sensitive=False)(
+            q,
+            visit_id=visit_id,
+            created_from=(
+                datetime.combine(date_from, time.min, tzinfo=UTC) if date_from else None
+            ),
+            created_to=(
+                datetime.combine(date_to, time.max, tzinfo=UTC) if date_to else None
+            ),
+            speaker=speaker,
+            kind=kind,
+            page=page,
+            page_size=page_size,
+        )
+        return JsonResponse(results)
+    except SchedulerRejected as e:
+        return JsonResponse({"error": str(e)}, status=503)
+    except Exception:
+        logger.exception("Error searching visits")
+        return JsonResponse({"error": "Internal server error"}, status=500)
@@ -14,9 +14,9 @@ class SpeakerUpdateSchema(Schema):
 
 
 @router.post("/update_speaker")
-def update_speaker(request, data: SpeakerUpdateSchema):
+async def update_speaker(request, data: SpeakerUpdateSchema):
     try:
-        visit = Visit.objects.get(id=data.visit_id)
+        visit = await Visit.objects.aget(id=data.visit_id)
 
         # Get existing speaker mapping or create new one
         speaker_mapping = visit.transcript_json.get("speaker_mapping", {})
@@ -26,7 +26,7 @@ def update_speaker(request, data: SpeakerUpdateSchema):
 
         # Update the transcript_json with new mapping
         visit.transcript_json["speaker_mapping"] = speaker_mapping
-        visit.save()
+        await visit.asave()
 
         return {"success": True, "message": "Speaker mapping updated successfully"}
     except Visit.DoesNotExist:
@@ -0,0 +1,114 @@
+import logging
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from ninja import Router, Schema
+
+from transcribe.tasks import transcribe_audio
+from visits.models import UploadSession, Visit
+from visits.uploads import (
+    UploadError,
+    finalize_upload,
+    hash_part,
+    initiate_upload,
+    record_range,
+    serialize_session,
+    validate_chunk,
+    write_part,
+)
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+
+class UploadInitSchema(Schema):
+    filename: str
+    size: int
+    sha256: str
+
+
+@router.post("/visits/{visit_id}/uploads", tags=["Uploads"])
+def create_upload(request, visit_id: int, data: UploadInitSchema):
+    """Start a resumable audio upload."""
+    try:
+        visit = Visit.objects.get(id=visit_id)
+        session = initiate_upload(visit, data.filename, data.size, data.sha256)
+        return JsonResponse(serialize_session(session), status=201)
+    except Visit.DoesNotExist:
+        return JsonResponse({"error": "Visit not found"}, status=404)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.exception("Error starting upload")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@router.get("/uploads/{upload_id}", tags=["Uploads"])
+def get_upload(request, upload_id: UUID):
+    """Report which byte ranges have been received, to resume an upload."""
+    try:
+        session = UploadSession.objects.get(id=upload_id)
+        return JsonResponse(serialize_session(session))
+    except UploadSession.DoesNotExist:
+        return JsonResponse({"error": "Upload not found"}, status=404)
+
+
+@router.put("/uploads/{upload_id}", tags=["Uploads"])
+async def upload_chunk(request, upload_id: UUID):
+    """
+    Upload one byte range of the file.
+
+    The body is the raw chunk, described by `Content-Range: bytes
+    start-end/total` and checked against `X-Chunk-SHA256`.
+    """
+    try:
+        session = await UploadSession.objects.aget(id=upload_id)
+        data = request.body
+        start, end = validate_chunk(
+            session,
+            request.headers.get("Content-Range"),
+            data,
+            request.headers.get("X-Chunk-SHA256"),
+        )
+        await sync_to_async(write_part, thread_sensitive=False)(session.id, start, data)
+        session = await sync_to_async(record_range)(session.id, start, end)
+        return JsonResponse(serialize_session(session))
+    except UploadSession.DoesNotExist:
+        return JsonResponse({"error": "Upload not found"}, status=404)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.exception("Error writing upload chunk")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@router.post("/uploads/{upload_id}/finalize", tags=["Uploads"])
+async def finalize(request, upload_id: UUID):
+    """
+    Verify the whole-file hash, store the audio and start transcription.
+
+    Audio identical to an earlier upload is stored once and reported as
+    `deduplicated`.
+    """
+    try:
+        session = await UploadSession.objects.select_related("visit").aget(id=upload_id)
+        # Hashing a long recording takes seconds, keep it off shared threads
+        file_sha256 = await sync_to_async(hash_part, thread_sensitive=False)(session)
+        blob, deduplicated, finalized = await sync_to_async(finalize_upload)(
+            session, file_sha256
+        )
+        # Only the call that finalized the upload starts transcription
+        if finalized:
+            transcribe_audio(session.visit)
+        return JsonResponse(
+            {**serialize_session(session, blob), "deduplicated": deduplicated}
+        )
+    except UploadSession.DoesNotExist:
+        return JsonResponse({"error": "Upload not found"}, status=404)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    except Exception as e:
+        logger.exception("Error finalizing upload")
+        return JsonResponse({"error": str(e)}, status=500)
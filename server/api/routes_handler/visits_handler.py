@@ -1,28 +1,39 @@
+from datetime import UTC, date, datetime, time
+from asgiref.sync import sync_to_async
 from ninja import Router
-from django.core.files.storage import default_storage
-from django.core.files.uploadedfile import UploadedFile
+from api.streaming import streaming_response
 from visits.models import Visit
+from visits.audio import audio_response
+from visits.exports import iter_feedback_records, iter_ndjson
+from visits.pagination import InvalidCursor, decode_cursor, encode_cursor
+from visits.storage import link_blob, store_blob, write_uploaded_file
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
 from django.http import JsonResponse
-import os
 import logging
-from transcribe.tasks import transcribe_audio, regenerate_soap
+from transcribe.models import PipelineState
+from transcribe.status import serialize_state
+from transcribe.timeline import resolve_references
+from transcribe.tasks import index_final_soap, transcribe_audio, regenerate_soap
 import json
+import os
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+MAX_PAGE_SIZE = 200
 
-def store_audio_file(file: UploadedFile, visit_id: int) -> str:
-    # TODO: Write to some object store
-    filename = f"visit_{visit_id}_{file.name}"
-    file_path = os.path.join("audio", filename)
+# Enough to locate and describe a visit's audio, without decoding the
+# transcript or SOAP notes
+AUDIO_FIELDS = ("id", "audio_file", "audio_sha256", "audio_blob__size")
 
-    with default_storage.open(file_path, "wb") as destination:
-        for chunk in file.chunks():
-            destination.write(chunk)
 
-    return file_path
+def _audio_url(visit: Visit) -> str | None:
+    if not visit.audio_file:
+        return None
+    url = f"/rest/visits/{visit.id}/audio"
+    # Versioned by content so the response can be cached as immutable
+    return f"{url}?v={visit.audio_sha256[:16]}" if visit.audio_sha256 else url
 
 
 @router.post("/visits", tags=["Visits"])
@@ -31,16 +42,96 @@ def create_visit(request):
     return JsonResponse({"id": visit.id})
 
 
+@router.get("/visits", tags=["Visits"])
+def list_visits(
+    request,
+    cursor: str | None = None,
+    page_size: int = 50,
+    status: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+):
+    """
+    List visits, newest first, without their transcript and SOAP payloads.
+
+    Pagination is keyset based: pass `next_cursor` from the previous page to
+    get the next one.
+    """
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return JsonResponse(
+            {"error": f"page_size must be between 1 and {MAX_PAGE_SIZE}"}, status=400
+        )
+
+    visits = Visit.objects.annotate(
+        status=F("pipeline_state__status"),
+        finalized=ExpressionWrapper(
+            Q(final_soap_note__isnull=False), output_field=BooleanField()
+        ),
+    ).order_by("-created_at", "-id")
+
+    if cursor:
+        try:
+            created_at, visit_id = decode_cursor(cursor)
+        except InvalidCursor as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        visits = visits.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=visit_id)
+        )
+    if status:
+        visits = visits.filter(pipeline_state__status=status)
+    if date_from:
+        visits = visits.filter(
+            created_at__gte=datetime.combine(date_from, time.min, tzinfo=UTC)
+        )
+    if date_to:
+        visits = visits.filter(
+            created_at__lte=datetime.combine(date_to, time.max, tzinfo=UTC)
+        )
+
+    rows = list(
+        visits.values(
+            "id", "audio_file", "status", "finalized", "created_at", "updated_at"
+        )[: page_size + 1]
+    )
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    return JsonResponse(
+        {
+            "visits": [
+                {
+                    **row,
+                    "audio_file": Visit.audio_file.field.storage.url(row["audio_file"])
+                    if row["audio_file"]
+                    else None,
+                    "created_at": row["created_at"].isoformat(),
+                    "updated_at": row["updated_at"].isoformat(),
+                }
+                for row in rows
+            ],
+            "next_cursor": encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+            if has_more
+            else None,
+        }
+    )
+
+
 @router.post("/visits/{visit_id}/audio", tags=["Visits"])
-def upload_audio(request, visit_id: int):
+async def upload_audio(request, visit_id: int):
     try:
-        visit = Visit.objects.get(id=visit_id)
-        audio_file = request.FILES.get("audio")
+        visit = await Visit.objects.aget(id=visit_id)
+        # Multipart parsing spools to disk for large files, keep it off the loop
+        audio_file = await sync_to_async(request.FILES.get)("audio")
         if audio_file:
-            # Store the file
-            file_path = store_audio_file(audio_file, visit_id)
-            visit.audio_file = file_path
-            visit.save()
+            # Store the file, reusing identical audio that is already stored
+            path, sha256 = await sync_to_async(
+                write_uploaded_file, thread_sensitive=False
+            )(audio_file)
+            blob, _ = await sync_to_async(store_blob)(
+                path, sha256, audio_file.name, move=True
+            )
+            await sync_to_async(link_blob)(visit, blob)
+            file_path = blob.file.name
 
             # Start processs for transcribing
             transcribe_audio(visit)
@@ -56,26 +147,16 @@ def upload_audio(request, visit_id: int):
 
 
 @router.get("/visits/{visit_id}", tags=["Visits"])
-def get_visit_details(request, visit_id: int):
+async def get_visit_details(request, visit_id: int):
     try:
-        visit = Visit.objects.get(id=visit_id)
-        polling_items = list(
-            visit.pollings.values(
-                "id",
-                "status",
-                "completed",
-                "error",
-                "success",
-                "created_at",
-                "updated_at",
-            ).order_by("created_at")
-        )
+        visit = await Visit.objects.select_related("pipeline_state").aget(id=visit_id)
 
         return JsonResponse(
             {
                 "visit": {
                     "id": visit.id,
                     "audio_file": visit.audio_file.url if visit.audio_file else None,
+                    "audio_url": _audio_url(visit),
                     "transcript_text": visit.transcript_text,
                     "transcript_json": visit.transcript_json,
                     "draft_soap_note": visit.draft_soap_note,
@@ -83,20 +164,100 @@ def get_visit_details(request, visit_id: int):
                     "created_at": visit.created_at.isoformat(),
                     "updated_at": visit.updated_at.isoformat(),
                 },
-                "pollings": polling_items,
+                "status": serialize_state(getattr(visit, "pipeline_state", None)),
+            }
+        )
+    except Visit.DoesNotExist:
+        return JsonResponse({"error": "Visit not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@router.get("/visits/{visit_id}/audio", tags=["Visits"])
+async def get_visit_audio(request, visit_id: int, v: str | None = None):
+    """
+    Stream the visit's audio, honouring `Range` requests so players can seek
+    to a referenced sentence without downloading the whole recording.
+    """
+    try:
+        visit = await (
+            Visit.objects.select_related("audio_blob")
+            .only(*AUDIO_FIELDS)
+            .aget(id=visit_id)
+        )
+        if not visit.audio_file:
+            return JsonResponse({"error": "Visit has no audio"}, status=404)
+        path = visit.audio_file.path
+        if not os.path.exists(path):
+            return JsonResponse({"error": "Audio file not found"}, status=404)
+
+        if visit.audio_sha256:
+            etag = visit.audio_sha256
+        else:
+            stat = os.stat(path)
+            etag = f"{stat.st_size:x}-{int(stat.st_mtime):x}"
+        # A URL carrying the current content version never changes
+        if visit.audio_sha256 and v and visit.audio_sha256.startswith(v):
+            cache_control = "private, max-age=31536000, immutable"
+        else:
+            cache_control = "private, no-cache"
+
+        return audio_response(request, path, etag, cache_control)
+    except Visit.DoesNotExist:
+        return JsonResponse({"error": "Visit not found"}, status=404)
+    except Exception as e:
+        logger.exception("Error streaming visit audio")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@router.get("/visits/{visit_id}/references", tags=["Visits"])
+def get_visit_references(request, visit_id: int, sentence_ids: str | None = None):
+    """
+    Resolve SOAP references (comma separated `sentence_ids`, or every
+    sentence when omitted) to their time range in the audio and an estimated
+    byte range, without loading the transcript.
+    """
+    try:
+        visit = (
+            Visit.objects.select_related("audio_blob")
+            .only(*AUDIO_FIELDS)
+            .get(id=visit_id)
+        )
+        ids = None
+        if sentence_ids:
+            ids = [int(sentence_id) for sentence_id in sentence_ids.split(",")]
+
+        return JsonResponse(
+            {
+                "visit_id": visit.id,
+                "audio_url": _audio_url(visit),
+                "references": resolve_references(visit, ids),
             }
         )
+    except ValueError:
+        return JsonResponse(
+            {"error": "sentence_ids must be comma separated integers"}, status=400
+        )
     except Visit.DoesNotExist:
         return JsonResponse({"error": "Visit not found"}, status=404)
     except Exception as e:
+        logger.exception("Error resolving visit references")
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@router.get("/visits/{visit_id}/status", tags=["Visits"])
+async def get_visit_status(request, visit_id: int):
+    """Current pipeline status only, for cheap polling."""
+    state = await PipelineState.objects.filter(visit_id=visit_id).afirst()
+    if state is None and not await Visit.objects.filter(id=visit_id).aexists():
+        return JsonResponse({"error": "Visit not found"}, status=404)
+    return JsonResponse({"visit_id": visit_id, "status": serialize_state(state)})
+
+
 @router.post("/visits/{visit_id}/regenerate_soap", tags=["Visits"])
 def request_regenerate_soap(request, visit_id: int):
     try:
         visit = Visit.objects.get(id=visit_id)
-        visit.pollings.all().delete()
         regenerate_soap(visit)
 
     except Visit.DoesNotExist:
@@ -131,6 +292,7 @@ def soap_feedback(request, visit_id: int):
         }
 
         visit.save()
+        index_final_soap(visit)
         return JsonResponse({"status": "success"})
 
     except Visit.DoesNotExist:
@@ -140,3 +302,27 @@ def soap_feedback(request, visit_id: int):
     except Exception as e:
         logger.error(f"Error updating SOAP note: {str(e)}")
         return JsonResponse({"error": "Internal server error"}, status=500)
+
+
+@router.get("/exports/soap_feedback", tags=["Visits"])
+def export_soap_feedback(request, cursor: str | None = None):
+    """
+    Stream clinician edits of draft SOAP notes as NDJSON, one visit per line.
+
+    Pass the `cursor` of the last line received to only get visits edited
+    since then. Staff only.
+    """
+    # Clinician edits are patient data: staff only, via the admin login
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff access required"}, status=403)
+    try:
+        if cursor:
+            decode_cursor(cursor)
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return streaming_response(
+        request,
+        iter_ndjson(iter_feedback_records(cursor)),
+        content_type="application/x-ndjson",
+    )
@@ -43,6 +43,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.middleware.ProfileMiddleware",
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -70,6 +71,8 @@ TEMPLATES = [
     },
 ]
 
+WSGI_APPLICATION = "api.wsgi.application"
+
 ASGI_APPLICATION = "api.asgi.application"
 
 
@@ -125,6 +128,76 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Resumable uploads
+# Suggested and maximum chunk size; must stay below DATA_UPLOAD_MAX_MEMORY_SIZE
+# (2.5 MB by default) since chunks are read from request.body
+
+UPLOAD_CHUNK_SIZE = 2 * 1024 * 1024
+
+# Vector indexes
+# Per-visit Chroma indexes, one subdirectory per transcript content hash
+
+CHROMA_TRANSCRIPTS_DIR = BASE_DIR / "chromadb_transcripts"
+
+# Shared index over all visits' sentences and final SOAP notes
+CHROMA_SEARCH_DIR = BASE_DIR / "chromadb_search"
+
+# Pipeline events
+# The Polling event log is append-only; prune_pipeline_events removes events
+# older than this. Current status lives in PipelineState and is never pruned.
+
+PIPELINE_EVENT_RETENTION_DAYS = int(os.getenv("PIPELINE_EVENT_RETENTION_DAYS", "30"))
+
+# Model scheduler
+# Admission control in front of the shared LLM / embeddings backends. Calls are
+# admitted by priority (interactive > live > backfill), limited per model, and
+# rejected when the queue is full or they have waited past their timeout.
+
+MODEL_SCHEDULER = {
+    "concurrency": {
+        "llm": int(os.getenv("LLM_CONCURRENCY", "1")),
+        "embeddings": int(os.getenv("EMBEDDINGS_CONCURRENCY", "2")),
+    },
+    "max_queue_depth": int(os.getenv("MODEL_MAX_QUEUE_DEPTH", "100")),
+    # Seconds a call may wait in the queue before it is rejected
+    "timeouts": {
+        "interactive": 60,
+        "live": 300,
+        "backfill": 3600,
+    },
+}
+
+# SOAP extraction
+# "retrieval" asks one similarity query per section and keeps its top hits.
+# "prototype" scores every sentence against per-section prototype vectors in
+# one pass, keeping each section whose similarity clears the threshold and is
+# within the margin of the sentence's best section. Setting max_sentences caps
+# each section at its best scoring sentences so the prompt fits a small
+# context window; the number dropped is logged and kept in the draft SOAP
+# note. Unset, every assigned sentence is kept.
+
+SOAP_EXTRACTION = {
+    "mode": os.getenv("SOAP_EXTRACTION_MODE", "retrieval"),
+    "threshold": float(os.getenv("SOAP_PROTOTYPE_THRESHOLD", "0.3")),
+    "margin": float(os.getenv("SOAP_PROTOTYPE_MARGIN", "0.05")),
+    "max_sentences": int(os.environ["SOAP_PROTOTYPE_MAX_SENTENCES"])
+    if os.getenv("SOAP_PROTOTYPE_MAX_SENTENCES")
+    else None,
+}
+
+# Profiling
+# Opt-in cProfile traces, stored per visit and listed under /rest/admin/profiles.
+# With "requests" on, a request sending the header is profiled; with
+# "pipeline" on, every transcription / regeneration run is.
+
+PROFILING = {
+    "requests": os.getenv("PROFILE_REQUESTS", "0") == "1",
+    "header": "X-Profile",
+    "pipeline": os.getenv("PROFILE_PIPELINE", "0") == "1",
+    # Functions kept in the stored text summary, by cumulative time
+    "summary_lines": 40,
+}
+
 # Logging configuration
 LOGGING = {
     "version": 1,
@@ -0,0 +1,38 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+STREAM_BATCH_SIZE = 100
+
+
+async def aiter_sync(iterator, batch_size: int = STREAM_BATCH_SIZE):
+    """
+    Consume a sync iterator from async code, `batch_size` items per thread
+    hop.
+
+    Batches run thread sensitive, so an iterator reading a database cursor
+    keeps using the connection it was opened on.
+    """
+    iterator = iter(iterator)
+    try:
+        while batch := await sync_to_async(list)(islice(iterator, batch_size)):
+            for item in batch:
+                yield item
+    finally:
+        if hasattr(iterator, "close"):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_response(request, iterator, **kwargs) -> StreamingHttpResponse:
+    """
+    Stream `iterator` under either server without buffering it.
+
+    Under ASGI Django collects a sync iterator into a list before sending
+    it, so it is handed over as an async iterator instead. Under WSGI the
+    sync iterator is kept, as an async one would be collected there.
+    """
+    if isinstance(request, ASGIRequest):
+        iterator = aiter_sync(iterator)
+    return StreamingHttpResponse(iterator, **kwargs)
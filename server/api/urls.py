@@ -5,6 +5,9 @@ from .routes_handler.health_handler import router as health_router
 from .routes_handler.socket_handler import router as socket_router
 from .routes_handler.visits_handler import router as visits_router
 from .routes_handler.transcribe_handler import router as transcribe_router
+from .routes_handler.search_handler import router as search_router
+from .routes_handler.uploads_handler import router as uploads_router
+from .routes_handler.profiles_handler import router as profiles_router
 
 
 api = NinjaAPI()
@@ -13,6 +16,9 @@ api.add_router("", health_router)  # /live
 api.add_router("", socket_router)
 api.add_router("", visits_router)
 api.add_router("", transcribe_router)
+api.add_router("", search_router)
+api.add_router("", uploads_router)
+api.add_router("", profiles_router)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -0,0 +1,153 @@
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from langchain_community.vectorstores import Chroma
+
+logger = logging.getLogger(__name__)
+
+# Example phrasings of what belongs in each section. A section's prototype
+# is the normalised mean of their embeddings; the first phrase of each is
+# the query the retrieval mode asks.
+SECTION_PROTOTYPES = {
+    "subjective": [
+        "patient symptoms or health concerns or pain or discomfort",
+        "I have been feeling unwell for a few days",
+        "the pain started last week and gets worse at night",
+        "my medical history and the medications I take",
+    ],
+    "objective": [
+        "objective findings",
+        "blood pressure, heart rate and temperature measurements",
+        "on examination the abdomen is soft and non tender",
+        "lab results and imaging findings",
+    ],
+    "assessment": [
+        "assessment or diagnosis",
+        "this looks like an infection",
+        "the most likely cause of your symptoms is",
+        "differential diagnosis",
+    ],
+    "plan": [
+        "treatment plan or recommendations",
+        "I am going to prescribe a medication, take it twice a day",
+        "come back for a follow up appointment in two weeks",
+        "we will order further tests and refer you to a specialist",
+    ],
+}
+
+_prototypes = {}
+_prototypes_lock = threading.Lock()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def section_prototypes(embeddings) -> tuple[list[str], np.ndarray]:
+    """
+    `(sections, matrix)` with one unit prototype vector per section row.
+
+    Computed once per embedding model and process, so classifying a visit
+    makes no embedding calls beyond its sentences' (already indexed) ones.
+    """
+    key = id(embeddings)
+    with _prototypes_lock:
+        if key not in _prototypes:
+            sections = list(SECTION_PROTOTYPES)
+            phrases = [p for section in sections for p in SECTION_PROTOTYPES[section]]
+            vectors = _normalize(np.asarray(embeddings.embed_documents(phrases)))
+            rows, offset = [], 0
+            for section in sections:
+                count = len(SECTION_PROTOTYPES[section])
+                rows.append(vectors[offset : offset + count].mean(axis=0))
+                offset += count
+            _prototypes[key] = (sections, _normalize(np.stack(rows)))
+        return _prototypes[key]
+
+
+def assign_sections(
+    sentence_vectors: np.ndarray,
+    prototypes: np.ndarray,
+    threshold: float,
+    margin: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Score every sentence against every prototype in one matrix multiply.
+
+    Returns `(scores, mask)`, both sentences x sections. A sentence belongs
+    to each section whose cosine similarity is at least `threshold` and
+    within `margin` of its best section, so it may land in several sections
+    or, when it is off topic, in none.
+    """
+    scores = _normalize(sentence_vectors) @ prototypes.T
+    best = scores.max(axis=1, keepdims=True)
+    mask = (scores >= threshold) & (scores >= best - margin)
+    return scores, mask
+
+
+def classify_sentences(
+    vectorstore: Chroma,
+    threshold: float | None = None,
+    margin: float | None = None,
+    max_sentences: int | None = None,
+) -> tuple[dict, dict]:
+    """
+    Extract details for every SOAP section from a visit's index in one pass.
+
+    Returns `(details, dropped)`. `details` has the shape of
+    `retrieve_section_sentences`: per section, the assigned sentences in
+    transcript order, each with its similarity `score`. Every assigned
+    sentence is kept unless a cap is configured: with `max_sentences` a
+    section keeps only its best scoring ones, so a long visit cannot
+    overflow the generation prompt, and `dropped` counts per section the
+    sentences the cap removed.
+    """
+    config = settings.SOAP_EXTRACTION
+    threshold = config["threshold"] if threshold is None else threshold
+    margin = config["margin"] if margin is None else margin
+    if max_sentences is None:
+        max_sentences = config["max_sentences"]
+
+    sections, prototypes = section_prototypes(vectorstore.embeddings)
+    details = {section: [] for section in sections}
+    dropped = {section: 0 for section in sections}
+    data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+    if not data["ids"]:
+        return details, dropped
+
+    scores, mask = assign_sections(
+        np.asarray(data["embeddings"], dtype=np.float32),
+        prototypes,
+        threshold,
+        margin,
+    )
+    order = sorted(
+        range(len(data["ids"])), key=lambda i: data["metadatas"][i]["sentence_id"]
+    )
+    for column, section in enumerate(sections):
+        selected = [i for i in order if mask[i, column]]
+        if max_sentences is not None and len(selected) > max_sentences:
+            ranked = sorted(selected, key=lambda i: -scores[i, column])
+            best = set(ranked[:max_sentences])
+            dropped[section] = len(selected) - max_sentences
+            selected = [i for i in selected if i in best]
+            logger.warning(
+                f"Capped {section} at {max_sentences} sentences, "
+                f"dropped {dropped[section]}"
+            )
+        for i in selected:
+            metadata = data["metadatas"][i]
+            details[section].append(
+                {
+                    "sentence_id": metadata["sentence_id"],
+                    "sentence_text": data["documents"][i],
+                    "speaker": metadata["speaker"],
+                    "start": metadata.get("start"),
+                    "end": metadata.get("end"),
+                    "score": float(scores[i, column]),
+                }
+            )
+    return details, dropped
@@ -1,46 +1,118 @@
 from pathlib import Path
 from django.conf import settings
+from ijson.common import ObjectBuilder
 import os
-import json
 import time
+import ijson
 import requests
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
+ALTERNATIVE_PREFIX = "results.channels.item.alternatives.item"
+WORDS_PREFIX = f"{ALTERNATIVE_PREFIX}.words.item"
+TRANSCRIPT_PREFIX = f"{ALTERNATIVE_PREFIX}.transcript"
 
-def _read_cache(audio_file_path: str):
-    # TODO: Read from s3 or some cloud object store
+
+class DeepgramError(Exception):
+    pass
+
+
+def _cache_file(audio_file_path: str) -> Path:
+    # TODO: Read from / write to s3 or some cloud object store
     cache_dir = Path(settings.BASE_DIR) / "transcript_cache"
     cache_dir.mkdir(exist_ok=True)
+    return cache_dir / f"{os.path.basename(audio_file_path)}.json"
 
-    cache_file = cache_dir / f"{os.path.basename(audio_file_path)}.json"
+
+def _read_cache(audio_file_path: str):
+    cache_file = _cache_file(audio_file_path)
 
     # # TODO: REMOVE LATER. Find the first JSON file and return it
-    # json_files = list(cache_dir.glob("*.json"))
+    # json_files = list(cache_file.parent.glob("*.json"))
     # if json_files:
     #     # Use the first JSON file found
     #     cache_file = json_files[0]
     #     logger.info(f"Using cached transcript from {cache_file.name}")
 
     if cache_file.exists():
-        with open(cache_file, "r") as f:
-            return json.load(f)
+        with open(cache_file, "rb") as f:
+            return parse_transcript(f)
 
     logger.info("No cached transcripts found")
     return None
 
 
-def _write_cache(audio_file_path: str, transcript_data: dict):
-    # TODO: Write to s3 or some cloud object store
-    cache_dir = Path(settings.BASE_DIR) / "transcript_cache"
-    cache_dir.mkdir(exist_ok=True)
-    cache_file = cache_dir / f"{os.path.basename(audio_file_path)}.json"
-    with open(cache_file, "w") as f:
-        json.dump(transcript_data, f)
+class _TeeReader:
+    """File-like reader that copies every byte it reads into `sink`."""
 
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        if data:
+            self.sink.write(data)
+        return data
+
+
+def iter_transcript_events(stream):
+    """
+    Incrementally parse a Deepgram response body.
+
+    Yields `("transcript", text)` and then `("word", word)` for every word of
+    the first alternative of the first channel, without ever holding the
+    whole response in memory.
+    """
+    channel = alternative = -1
+    builder = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if event == "start_map" and prefix == "results.channels.item":
+            channel += 1
+            alternative = -1
+        elif event == "start_map" and prefix == ALTERNATIVE_PREFIX:
+            alternative += 1
+        if channel != 0 or alternative != 0:
+            continue
+
+        if builder is not None:
+            builder.event(event, value)
+            if event == "end_map" and prefix == WORDS_PREFIX:
+                yield "word", builder.value
+                builder = None
+        elif event == "start_map" and prefix == WORDS_PREFIX:
+            builder = ObjectBuilder()
+            builder.event(event, value)
+        elif event == "string" and prefix == TRANSCRIPT_PREFIX:
+            yield "transcript", value
+
+
+def parse_transcript(stream) -> tuple[str, dict]:
+    """Parse a Deepgram response stream into `(transcript_text, transcript_json)`."""
+    transcript_text = ""
+
+    def words():
+        nonlocal transcript_text
+        for kind, value in iter_transcript_events(stream):
+            if kind == "transcript":
+                transcript_text = value
+            else:
+                yield value
+
+    sentences = list(segment_sentences(words()))
+    return transcript_text, {"sentences": sentences}
+
+
+def get_transcript_from_deepgram(audio_file_path: str) -> tuple[str, dict]:
+    """
+    Transcribe an audio file, returning `(transcript_text, transcript_json)`.
 
-def get_transcript_from_deepgram(audio_file_path: str) -> dict:
+    The audio is streamed from disk and the response is parsed straight off
+    the socket into sentences while its raw bytes are spooled to the cache
+    file, so memory use does not grow with the length of the recording.
+    """
     audio_size = os.path.getsize(audio_file_path)
     logger.info(f"Audio file size: {audio_size} bytes")
 
@@ -50,56 +122,51 @@ def get_transcript_from_deepgram(audio_file_path: str) -> dict:
 
     start_time = time.time()
 
-    # Read the audio file
-    with open(audio_file_path, "rb") as f:
-        audio_bytes = f.read()
-    read_time = time.time() - start_time
-    logger.info(f"Time taken to read audio file: {read_time:.2f} seconds")
-
     # Make the API request
     DG_API_KEY = os.getenv("DEEPGRAM_API_KEY")
     if not DG_API_KEY:
         raise ValueError("DEEPGRAM_API_KEY not found in environment variables")
-    response = requests.post(
-        "https://api.deepgram.com/v1/listen",
-        params={"model": "nova-2-medical", "diarize": "true", "punctuate": "true"},
-        headers={"Authorization": f"Token {DG_API_KEY}", "Content-Type": "audio/webm"},
-        data=audio_bytes,
-    )
-    api_time = time.time() - start_time
-    logger.info(f"Time taken for Deepgram API call: {api_time:.2f} seconds")
-    if response.status_code != 200:
-        raise Exception(f"Deepgram API error: {response.text}")
-    transcript_data = response.json()
-
-    _write_cache(audio_file_path, transcript_data)
-
-    return transcript_data
-
-
-def preprocess_transcript(transcript_data: dict) -> dict:
+    with open(audio_file_path, "rb") as audio_file:
+        response = requests.post(
+            "https://api.deepgram.com/v1/listen",
+            params={"model": "nova-2-medical", "diarize": "true", "punctuate": "true"},
+            headers={
+                "Authorization": f"Token {DG_API_KEY}",
+                "Content-Type": "audio/webm",
+            },
+            data=audio_file,
+            stream=True,
+        )
+
+    with response:
+        api_time = time.time() - start_time
+        logger.info(f"Time taken for Deepgram API call: {api_time:.2f} seconds")
+        if response.status_code != 200:
+            raise DeepgramError(f"Deepgram API error: {response.text}")
+
+        response.raw.decode_content = True
+        cache_file = _cache_file(audio_file_path)
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp_file, "wb") as sink:
+                result = parse_transcript(_TeeReader(response.raw, sink))
+            os.replace(tmp_file, cache_file)
+        finally:
+            if tmp_file.exists():
+                tmp_file.unlink()
+
+    parse_time = time.time() - start_time
+    logger.info(f"Time taken to receive and parse transcript: {parse_time:.2f} seconds")
+    return result
+
+
+def segment_sentences(words):
     """
-    Preprocess the transcript data to group words into sentences by speaker.
+    Group a stream of Deepgram words into sentences by speaker.
 
-    Args:
-        transcript_data: Raw transcript data from Deepgram API
-
-    Returns:
-        dict: Processed transcript with sentences grouped by speaker
+    Yields each sentence as soon as the speaker changes, so words can be fed
+    in one at a time.
     """
-    # Get the words from the transcript data
-    words = (
-        transcript_data.get("results", {})
-        .get("channels", [{}])[0]
-        .get("alternatives", [{}])[0]
-        .get("words", [])
-    )
-
-    if not words:
-        return {"sentences": []}
-
-    # Group words by speaker
-    sentences = []
     current_sentence = None
     current_speaker = None
 
@@ -107,7 +174,7 @@ def preprocess_transcript(transcript_data: dict) -> dict:
         if current_sentence is None or word["speaker"] != current_speaker:
             # Start a new sentence if we're starting or changing speaker
             if current_sentence:
-                sentences.append(current_sentence)
+                yield current_sentence
             current_sentence = {
                 "sentence_id": i,
                 "sentence": word["punctuated_word"],
@@ -125,6 +192,25 @@ def preprocess_transcript(transcript_data: dict) -> dict:
 
     # Add the last sentence if it exists
     if current_sentence:
-        sentences.append(current_sentence)
+        yield current_sentence
+
+
+def preprocess_transcript(transcript_data: dict) -> dict:
+    """
+    Preprocess the transcript data to group words into sentences by speaker.
+
+    Args:
+        transcript_data: Raw transcript data from Deepgram API
+
+    Returns:
+        dict: Processed transcript with sentences grouped by speaker
+    """
+    # Get the words from the transcript data
+    words = (
+        transcript_data.get("results", {})
+        .get("channels", [{}])[0]
+        .get("alternatives", [{}])[0]
+        .get("words", [])
+    )
 
-    return {"sentences": sentences}
+    return {"sentences": list(segment_sentences(words))}
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+
+from chromadb.api.shared_system_client import SharedSystemClient
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TMP_PREFIX = ".tmp-"
+
+# Index versions are named by their content hash; anything else found in a
+# visit's root (chroma.sqlite3, segment directories) is the legacy store
+# that used to be written there directly
+VERSION_NAME = re.compile(r"[0-9a-f]{32}")
+
+
+def visit_index_root(visit_id: int) -> Path:
+    return Path(settings.CHROMA_TRANSCRIPTS_DIR) / f"visit_{visit_id}"
+
+
+def index_key(texts: list, metadatas: list) -> str:
+    """Content hash of everything that ends up in a visit's vector index."""
+    payload = json.dumps([texts, metadatas], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def get_or_build_index(visit_id: int, key: str, open_index, build_index):
+    """
+    Return the vector index for `visit_id` whose content hash is `key`.
+
+    An existing index with the same key is opened with `open_index(path)`.
+    Otherwise `build_index(path)` writes a fresh index into a temporary
+    directory which is then renamed into place, so readers never see a half
+    built index, and indexes for older transcript versions are removed.
+    """
+    root = visit_index_root(visit_id)
+    index_dir = root / key
+    if index_dir.is_dir():
+        return open_index(str(index_dir))
+
+    root.mkdir(parents=True, exist_ok=True)
+    tmp_dir = root / f"{TMP_PREFIX}{key}-{uuid.uuid4().hex[:8]}"
+    build_index(str(tmp_dir))
+    release_index(tmp_dir)
+    try:
+        os.rename(tmp_dir, index_dir)
+    except OSError:
+        # Another worker built the same content concurrently
+        remove_path(tmp_dir)
+        if not index_dir.is_dir():
+            raise
+
+    for stale in root.iterdir():
+        if stale.name != key and not stale.name.startswith(TMP_PREFIX):
+            try:
+                remove_path(stale)
+            except FileNotFoundError:
+                # Already removed by a concurrent build
+                pass
+            except OSError as e:
+                logger.error(f"Error removing stale index {stale}: {e}")
+
+    return open_index(str(index_dir))
+
+
+def is_index_version(path: Path) -> bool:
+    return path.is_dir() and VERSION_NAME.fullmatch(path.name) is not None
+
+
+def release_index(path: Path):
+    """
+    Stop the Chroma system cached for an index directory.
+
+    Chroma keeps one system per persist directory for the life of the
+    process, holding its files open. Without this, removing or renaming the
+    directory would not free its disk space until the process restarts.
+    """
+    identifier = str(path)
+    with SharedSystemClient._refcount_lock:
+        SharedSystemClient._identifier_to_refcount.pop(identifier, None)
+        system = SharedSystemClient._identifier_to_system.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
+
+def remove_path(path: Path):
+    """Remove an index directory or a leftover file of the legacy store."""
+    if path.is_dir() and not path.is_symlink():
+        release_index(path)
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+
+
+def directory_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
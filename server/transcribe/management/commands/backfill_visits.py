@@ -0,0 +1,214 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from transcribe.models import PipelineState
+from transcribe.scheduler import Priority
+from transcribe.tasks import process_transcription
+from visits.models import Visit
+from visits.storage import sha256_file, store_blob
+
+AUDIO_EXTENSIONS = [".webm", ".wav", ".mp3", ".m4a", ".ogg", ".flac"]
+
+# Keep IN (...) lookups under SQLite's bound parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+# An unfinished run not updated for this long was interrupted, not running
+STALE_RUN_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Create visits for a directory of recorded audio and run the "
+        "transcription/RAG/SOAP pipeline on them. Files whose content hash "
+        "already has a completed backfill visit are skipped, so the command "
+        "can be re-run after an interruption: interrupted and failed backfill "
+        "visits are resumed, running ones left alone. Visits created any "
+        "other way are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", type=Path)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of visits processed in parallel",
+        )
+        parser.add_argument(
+            "--extensions",
+            default=",".join(AUDIO_EXTENSIONS),
+            help="Comma separated list of audio file extensions to pick up",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report which files would be ingested",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            default=None,
+            help="Store a cProfile trace of every visit's pipeline run",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        self.profile = options["profile"]
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+
+        extensions = {
+            ext.strip().lower() if ext.strip().startswith(".") else f".{ext.strip()}"
+            for ext in options["extensions"].split(",")
+            if ext.strip()
+        }
+        paths = sorted(
+            p
+            for p in directory.rglob("*")
+            if p.is_file() and p.suffix.lower() in extensions
+        )
+        self.stdout.write(f"Found {len(paths)} audio files in {directory}")
+
+        files_by_hash = {}
+        for index, path in enumerate(paths, start=1):
+            files_by_hash.setdefault(sha256_file(path), path)
+            if index % 100 == 0 or index == len(paths):
+                self.stdout.write(f"Hashed {index}/{len(paths)} files")
+
+        visits_by_hash = self._existing_visits(list(files_by_hash))
+        states = self._pipeline_states([visit.id for visit in visits_by_hash.values()])
+
+        pending = []
+        new_hashes = []
+        skipped = 0
+        running = 0
+        for sha256, path in files_by_hash.items():
+            visit = visits_by_hash.get(sha256)
+            state = states.get(visit.id) if visit else None
+            if visit is None:
+                new_hashes.append(sha256)
+            elif state is not None and state.status == "completed":
+                skipped += 1
+            elif state is not None and _is_running(state):
+                running += 1
+            else:
+                # Not started, interrupted or failed on a previous run:
+                # resume on the same visit
+                pending.append((visit, path))
+
+        duplicates = len(paths) - len(files_by_hash)
+        self.stdout.write(
+            f"{skipped} already completed, {running} running, "
+            f"{duplicates} duplicate files, "
+            f"{len(pending)} to resume, {len(new_hashes)} new"
+        )
+        if options["dry_run"]:
+            return
+
+        pending.extend(self._create_visits(new_hashes, files_by_hash))
+        self._store_audio(pending)
+        self._process(pending, options["workers"], skipped)
+
+    def _existing_visits(self, hashes):
+        visits = {}
+        for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+            batch = hashes[i : i + LOOKUP_BATCH_SIZE]
+            batch_visits = Visit.objects.filter(
+                source="backfill", audio_sha256__in=batch
+            ).order_by("id")
+            for visit in batch_visits:
+                visits.setdefault(visit.audio_sha256, visit)
+        return visits
+
+    def _pipeline_states(self, visit_ids):
+        states = {}
+        for i in range(0, len(visit_ids), LOOKUP_BATCH_SIZE):
+            batch = visit_ids[i : i + LOOKUP_BATCH_SIZE]
+            states.update(
+                (state.visit_id, state)
+                for state in PipelineState.objects.filter(visit_id__in=batch)
+            )
+        return states
+
+    def _create_visits(self, hashes, files_by_hash):
+        visits = Visit.objects.bulk_create(
+            [Visit(audio_sha256=sha256, source="backfill") for sha256 in hashes]
+        )
+        self.stdout.write(f"Created {len(visits)} visits")
+        return [(visit, files_by_hash[visit.audio_sha256]) for visit in visits]
+
+    def _store_audio(self, pending):
+        # Also covers visits created by a run that was interrupted before
+        # their audio was copied into storage
+        missing = [(visit, path) for visit, path in pending if not visit.audio_file]
+        for visit, path in missing:
+            blob, _ = store_blob(str(path), visit.audio_sha256, path.name)
+            visit.audio_blob = blob
+            visit.audio_file = blob.file.name
+        Visit.objects.bulk_update(
+            [visit for visit, _ in missing],
+            ["audio_blob", "audio_file"],
+            batch_size=LOOKUP_BATCH_SIZE,
+        )
+
+    def _process(self, pending, workers, skipped):
+        total = len(pending)
+        total_bytes = sum(path.stat().st_size for _, path in pending)
+        succeeded = 0
+        failed = []
+        start_time = time.time()
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = {
+                executor.submit(self._process_visit, visit): (visit, path)
+                for visit, path in pending
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                visit, path = futures[future]
+                ok, elapsed = future.result()
+                if ok:
+                    succeeded += 1
+                else:
+                    failed.append(path)
+                self.stdout.write(
+                    f"[{done}/{total}] {path.name} -> visit {visit.id} "
+                    f"{'ok' if ok else 'FAILED'} ({elapsed:.1f}s)"
+                )
+
+        elapsed = time.time() - start_time
+        self.stdout.write("")
+        self.stdout.write(f"Processed: {total} ({succeeded} ok, {len(failed)} failed)")
+        self.stdout.write(f"Skipped (already completed): {skipped}")
+        self.stdout.write(f"Elapsed: {elapsed:.1f}s")
+        if elapsed > 0 and total:
+            self.stdout.write(
+                f"Throughput: {total / elapsed * 60:.1f} visits/min, "
+                f"{total_bytes / elapsed / (1024 * 1024):.2f} MB/s of audio"
+            )
+        for path in failed:
+            self.stderr.write(f"Failed: {path}")
+
+    def _process_visit(self, visit: Visit):
+        start_time = time.time()
+        try:
+            process_transcription(
+                visit, priority=Priority.BACKFILL, profile=self.profile
+            )
+            completed = PipelineState.objects.filter(
+                visit=visit, status="completed"
+            ).exists()
+            return completed, time.time() - start_time
+        finally:
+            # Worker threads open their own connections
+            connection.close()
+
+
+def _is_running(state: PipelineState) -> bool:
+    stale_before = timezone.now() - timedelta(seconds=STALE_RUN_SECONDS)
+    return not state.completed and state.updated_at > stale_before
@@ -0,0 +1,232 @@
+import random
+import statistics
+import time
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+
+from transcribe.classify import classify_sentences, section_prototypes
+from transcribe.tasks import create_embeddings, retrieve_section_sentences
+from visits.models import Visit
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SOAP detail extraction by per-section retrieval (four top-5 "
+        "similarity queries) with one-pass prototype classification of every "
+        "sentence: time per visit and how much of the transcript each covers. "
+        "Runs on transcribed visits, or with --synthetic on generated "
+        "transcripts and random embeddings, which needs no model backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--visit", type=int, action="append", help="Visit id (may be repeated)"
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Most recent transcribed visits to use when no --visit is given",
+        )
+        parser.add_argument(
+            "--synthetic",
+            type=int,
+            action="append",
+            help="Benchmark a generated transcript of this many sentences "
+            "(may be repeated)",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed runs per visit and mode"
+        )
+        parser.add_argument("--threshold", type=float)
+        parser.add_argument("--margin", type=float)
+        parser.add_argument("--max-sentences", type=int)
+
+    def handle(self, *args, **options):
+        if options["synthetic"]:
+            cases = [
+                (f"synthetic-{n}", n, synthetic_store(n)) for n in options["synthetic"]
+            ]
+        else:
+            visits = Visit.objects.filter(transcript_json__isnull=False)
+            if options["visit"]:
+                visits = visits.filter(id__in=options["visit"])
+            visits = list(visits.order_by("-created_at")[: options["limit"]])
+            if not visits:
+                raise CommandError("No transcribed visits to benchmark")
+            cases = [
+                (
+                    f"visit-{visit.id}",
+                    len(visit.transcript_json["sentences"]),
+                    create_embeddings(visit),
+                )
+                for visit in visits
+            ]
+
+        if options["synthetic"]:
+            self.stdout.write(
+                "Synthetic embeddings are random: compare cost, not coverage."
+            )
+        threshold = options["threshold"]
+        margin = options["margin"]
+        max_sentences = options["max_sentences"]
+        config = settings.SOAP_EXTRACTION
+        if max_sentences is None:
+            max_sentences = config["max_sentences"]
+        self.stdout.write(
+            f"threshold={config['threshold'] if threshold is None else threshold} "
+            f"margin={config['margin'] if margin is None else margin} "
+            f"max_sentences={'none' if max_sentences is None else max_sentences}"
+        )
+        self.stdout.write(
+            f"{'case':<16}{'sents':>7}{'mode':>11}{'ms':>9}"
+            f"{'covered':>9}{'per sect':>10}{'recall':>8}{'embeds':>8}"
+            f"{'dropped':>9}"
+        )
+
+        totals = {"retrieval": [], "prototype": []}
+        try:
+            for name, sentence_count, vectorstore in cases:
+                # Prototype vectors are built once per process, not per visit
+                build_start = time.perf_counter()
+                section_prototypes(vectorstore.embeddings)
+                build_ms = (time.perf_counter() - build_start) * 1000
+
+                retrieval_ms, retrieval_calls, retrieved = measure(
+                    vectorstore,
+                    partial(retrieve_section_sentences, vectorstore),
+                    options["repeat"],
+                )
+                prototype_ms, prototype_calls, (classified, dropped) = measure(
+                    vectorstore,
+                    partial(
+                        classify_sentences,
+                        vectorstore,
+                        threshold,
+                        margin,
+                        max_sentences,
+                    ),
+                    options["repeat"],
+                )
+                totals["retrieval"].append(retrieval_ms)
+                totals["prototype"].append(prototype_ms)
+
+                for mode, elapsed, calls, details, cut in (
+                    ("retrieval", retrieval_ms, retrieval_calls, retrieved, "-"),
+                    (
+                        "prototype",
+                        prototype_ms,
+                        prototype_calls,
+                        classified,
+                        sum(dropped.values()),
+                    ),
+                ):
+                    covered, per_section = coverage(details, sentence_count)
+                    recall = (
+                        overlap(retrieved, classified) if mode == "prototype" else 1
+                    )
+                    self.stdout.write(
+                        f"{name:<16}{sentence_count:>7}{mode:>11}{elapsed:>9.2f}"
+                        f"{covered:>8.0%}{per_section:>10.1f}{recall:>8.0%}"
+                        f"{'-' if calls is None else calls:>8}{cut:>9}"
+                    )
+                self.stdout.write(f"{'':<16}{'':>7}{'(build)':>11}{build_ms:>9.2f}")
+        finally:
+            if options["synthetic"]:
+                for _, _, vectorstore in cases:
+                    vectorstore.delete_collection()
+
+        self.stdout.write("")
+        for mode, values in totals.items():
+            self.stdout.write(
+                f"{mode}: median {statistics.median(values):.2f} ms per visit"
+            )
+        self.stdout.write(
+            "covered: share of sentences assigned to at least one section. "
+            "recall: share of retrieval's hits the prototype mode also assigns "
+            "to the same section. embeds: embedding model calls per run, "
+            "counted for synthetic runs only (visit timings include them). "
+            "dropped: assigned sentences left out by --max-sentences."
+        )
+
+
+class CountingEmbeddings(Embeddings):
+    """Counts calls to the embedding model behind a synthetic index."""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self.embeddings.embed_query(text)
+
+
+def measure(vectorstore: Chroma, fn, repeat: int):
+    """
+    Median milliseconds of `repeat` calls, embedding calls per run (None
+    when they cannot be counted), and the last result.
+    """
+    counter = vectorstore.embeddings
+    counted = isinstance(counter, CountingEmbeddings)
+    calls_before = counter.calls if counted else 0
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        start_time = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start_time) * 1000)
+    calls = (counter.calls - calls_before) // max(1, repeat) if counted else None
+    return statistics.median(timings), calls, result
+
+
+def coverage(details: dict, sentence_count: int) -> tuple[float, float]:
+    assigned = {s["sentence_id"] for section in details.values() for s in section}
+    per_section = statistics.mean(len(section) for section in details.values())
+    return len(assigned) / sentence_count if sentence_count else 0, per_section
+
+
+def overlap(retrieved: dict, classified: dict) -> float:
+    hits = [
+        (section, s["sentence_id"]) for section in retrieved for s in retrieved[section]
+    ]
+    if not hits:
+        return 1
+    found = {
+        (section, s["sentence_id"])
+        for section in classified
+        for s in classified[section]
+    }
+    return sum(hit in found for hit in hits) / len(hits)
+
+
+def synthetic_store(sentence_count: int) -> Chroma:
+    """An in-memory visit index of random embeddings, like all-minilm's (384-d)."""
+    texts, metadata = [], []
+    for i in range(sentence_count):
+        speaker = f"Speaker {i % 2}"
+        texts.append(f"{speaker}: sentence {i}")
+        metadata.append(
+            {
+                "sentence_id": i,
+                "speaker": speaker,
+                "start": i * 3.0,
+                "end": i * 3.0 + random.uniform(1, 3),
+            }
+        )
+    return Chroma.from_texts(
+        texts=texts,
+        embedding=CountingEmbeddings(FakeEmbeddings(size=384)),
+        metadatas=metadata,
+        collection_name=f"benchmark-{uuid.uuid4().hex}",
+    )
@@ -0,0 +1,121 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from transcribe import search_index
+from transcribe.indexes import (
+    TMP_PREFIX,
+    directory_size,
+    is_index_version,
+    remove_path,
+)
+from visits.models import Visit
+
+# Builds still in progress must not be collected
+STALE_TMP_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove per-visit vector indexes that are no longer needed: indexes "
+        "of deleted visits, of visits whose SOAP note has been finalized, "
+        "leftovers of interrupted builds, superseded index versions and the "
+        "legacy store written directly into a visit's directory. "
+        "Deleted visits are also dropped from the cross-visit search index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--finalized-retention-days",
+            type=int,
+            default=0,
+            help="Keep indexes of finalized visits updated within this many days",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be removed",
+        )
+
+    def handle(self, *args, **options):
+        root = Path(settings.CHROMA_TRANSCRIPTS_DIR)
+        if not root.is_dir():
+            self.stdout.write(f"No vector indexes found in {root}")
+            return
+
+        visit_dirs = {}
+        for path in root.iterdir():
+            prefix, _, visit_id = path.name.partition("_")
+            if path.is_dir() and prefix == "visit" and visit_id.isdigit():
+                visit_dirs[int(visit_id)] = path
+
+        finalized_before = timezone.now() - timedelta(
+            days=options["finalized_retention_days"]
+        )
+        visits = {
+            visit["id"]: visit
+            for visit in Visit.objects.filter(id__in=list(visit_dirs)).values(
+                "id", "final_soap_note", "updated_at"
+            )
+        }
+
+        removals = []
+        for visit_id, path in sorted(visit_dirs.items()):
+            visit = visits.get(visit_id)
+            if visit is None:
+                removals.append((path, "visit deleted"))
+            elif (
+                visit["final_soap_note"] is not None
+                and visit["updated_at"] <= finalized_before
+            ):
+                removals.append((path, "visit finalized"))
+            else:
+                removals.extend(self._stale_versions(path))
+
+        reclaimed = 0
+        failed = 0
+        for path, reason in removals:
+            size = directory_size(path)
+            self.stdout.write(f"{path.relative_to(root)}: {reason} ({size} bytes)")
+            if options["dry_run"]:
+                reclaimed += size
+                continue
+            try:
+                remove_path(path)
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f"Failed to remove {path}: {e}")
+                continue
+            reclaimed += size
+            if reason == "visit deleted":
+                search_index.remove_visit(int(path.name.partition("_")[2]))
+
+        verb = "Would reclaim" if options["dry_run"] else "Reclaimed"
+        self.stdout.write(
+            f"{verb} {reclaimed / (1024 * 1024):.2f} MB from "
+            f"{len(removals) - failed} paths ({len(visit_dirs)} visit indexes "
+            f"scanned, {failed} failed)"
+        )
+
+    def _stale_versions(self, visit_dir: Path):
+        now = time.time()
+        versions = []
+        stale = []
+        for path in visit_dir.iterdir():
+            if path.name.startswith(TMP_PREFIX):
+                if now - path.stat().st_mtime > STALE_TMP_SECONDS:
+                    stale.append((path, "interrupted build"))
+            elif is_index_version(path):
+                versions.append(path)
+            else:
+                stale.append((path, "legacy index"))
+
+        # Normally only one version survives a build; keep the newest if a
+        # concurrent build left more behind
+        versions.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+        stale.extend((path, "superseded version") for path in versions[1:])
+        return stale
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transcribe.timeline import index_sentence_times
+from visits.models import Visit
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the sentence time index for transcribed visits that have none, "
+        "e.g. visits transcribed before the index existed or whose transcript "
+        "was written outside the pipeline. With --all every transcribed visit "
+        "is reindexed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Reindex every transcribed visit, not only unindexed ones",
+        )
+        parser.add_argument(
+            "--visit-id",
+            type=int,
+            action="append",
+            help="Only index the given visit (may be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        visits = Visit.objects.filter(transcript_json__isnull=False).only(
+            "id", "transcript_json"
+        )
+        if not options["all"]:
+            visits = visits.filter(transcript_sentences__isnull=True)
+        if options["visit_id"]:
+            visits = visits.filter(id__in=options["visit_id"])
+
+        indexed = 0
+        failed = 0
+        for visit in visits.order_by("id").iterator(chunk_size=100):
+            try:
+                with transaction.atomic():
+                    index_sentence_times(visit)
+            except (KeyError, TypeError, ValueError) as e:
+                # Malformed transcript, keep going with the other visits
+                failed += 1
+                self.stderr.write(f"Visit {visit.id}: {e!r}")
+                continue
+            indexed += 1
+
+        self.stdout.write(f"Indexed {indexed} visits ({failed} failed)")
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from transcribe.status import prune_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete pipeline events (Polling rows) older than the retention "
+        "period. The current status of each visit is kept in PipelineState "
+        "and is not affected."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.PIPELINE_EVENT_RETENTION_DAYS,
+            help="Keep events created within this many days",
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_events(options["retention_days"])
+        self.stdout.write(
+            f"Deleted {deleted} pipeline events older than "
+            f"{options['retention_days']} days"
+        )
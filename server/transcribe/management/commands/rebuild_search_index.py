@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from transcribe import scheduler, search_index
+from transcribe.scheduler import Priority
+from transcribe.tasks import create_embeddings
+from visits.models import Visit
+
+
+class Command(BaseCommand):
+    help = (
+        "(Re)index visits into the shared cross-visit search index. Visit "
+        "indexes that are already built are reused, so only missing sentence "
+        "embeddings are computed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--visit-id",
+            type=int,
+            action="append",
+            help="Only index the given visit (may be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        visits = Visit.objects.filter(transcript_json__isnull=False).order_by("id")
+        if options["visit_id"]:
+            visits = visits.filter(id__in=options["visit_id"])
+
+        total = visits.count()
+        start_time = time.time()
+        failed = 0
+        with scheduler.priority(Priority.BACKFILL):
+            for index, visit in enumerate(visits.iterator(chunk_size=100), start=1):
+                try:
+                    vectorstore = create_embeddings(visit)
+                    search_index.index_visit_transcript(visit, vectorstore)
+                    if visit.final_soap_note:
+                        search_index.index_final_soap(visit)
+                except Exception as e:  # noqa: BLE001
+                    # One failing visit must not stop the rebuild
+                    failed += 1
+                    self.stderr.write(f"Visit {visit.id}: {e}")
+                if index % 100 == 0 or index == total:
+                    self.stdout.write(f"Indexed {index}/{total} visits")
+
+        self.stdout.write(f"Done in {time.time() - start_time:.1f}s ({failed} failed)")
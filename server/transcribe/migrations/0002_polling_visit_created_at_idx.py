@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:04
+# ruff: noqa: RUF012
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0001_initial'),
+        ('visits', '0005_visit_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='polling',
+            index=models.Index(fields=['visit', 'created_at'], name='polling_visit_created_at_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:06
+# ruff: noqa: RUF012
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+RUN_START_STATUSES = {"audio_processing_started", "regenerate_soap_started"}
+STAGE_PROGRESS = {
+    "audio_processing_started": 5,
+    "regenerate_soap_started": 40,
+    "transcription_complete": 40,
+    "details_extracted": 60,
+    "text_generated": 90,
+    "completed": 100,
+}
+
+
+def populate_pipeline_state(apps, schema_editor):
+    Polling = apps.get_model("transcribe", "Polling")
+    PipelineState = apps.get_model("transcribe", "PipelineState")
+
+    states = []
+    current = None
+    for polling in Polling.objects.order_by("visit_id", "created_at", "id").iterator():
+        if current is None or current.visit_id != polling.visit_id:
+            if current is not None:
+                states.append(current)
+            current = PipelineState(
+                visit_id=polling.visit_id, stages=[], started_at=polling.created_at
+            )
+        if polling.status in RUN_START_STATUSES:
+            current.stages = []
+            current.started_at = polling.created_at
+        if polling.status not in current.stages:
+            current.stages.append(polling.status)
+        current.status = polling.status
+        current.progress = STAGE_PROGRESS.get(polling.status, current.progress)
+        current.completed = polling.completed
+        current.success = polling.success
+        current.error = polling.error
+    if current is not None:
+        states.append(current)
+
+    PipelineState.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0002_polling_visit_created_at_idx'),
+        ('visits', '0005_visit_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='polling',
+            name='status',
+            field=models.CharField(choices=[('audio_processing_started', 'Audio Processing Started'), ('regenerate_soap_started', 'Regenerate SOAP Started'), ('transcription_complete', 'Transcription Complete'), ('details_extracted', 'Details Extracted'), ('text_generated', 'Text Generated'), ('completed', 'Completed'), ('error', 'Error')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='PipelineState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('audio_processing_started', 'Audio Processing Started'), ('regenerate_soap_started', 'Regenerate SOAP Started'), ('transcription_complete', 'Transcription Complete'), ('details_extracted', 'Details Extracted'), ('text_generated', 'Text Generated'), ('completed', 'Completed'), ('error', 'Error')], db_index=True, max_length=50)),
+                ('stages', models.JSONField(default=list)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('success', models.BooleanField(null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_state', to='visits.visit')),
+            ],
+        ),
+        migrations.RunPython(populate_pipeline_state, migrations.RunPython.noop),
+    ]
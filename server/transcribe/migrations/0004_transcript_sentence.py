@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:16
+# ruff: noqa: RUF012
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_transcript_sentences(apps, schema_editor):
+    Visit = apps.get_model("visits", "Visit")
+    TranscriptSentence = apps.get_model("transcribe", "TranscriptSentence")
+
+    rows = []
+    visits = Visit.objects.filter(transcript_json__isnull=False).only(
+        "id", "transcript_json"
+    )
+    for visit in visits.iterator(chunk_size=100):
+        for sentence in (visit.transcript_json or {}).get("sentences", []):
+            speaker = sentence.get("speaker")
+            rows.append(
+                TranscriptSentence(
+                    visit_id=visit.id,
+                    sentence_id=sentence["sentence_id"],
+                    start=sentence["start"],
+                    end=sentence["end"],
+                    speaker=None if speaker is None else str(speaker),
+                )
+            )
+        if len(rows) >= 5000:
+            TranscriptSentence.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    TranscriptSentence.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0003_pipeline_state'),
+        ('visits', '0006_audio_blob_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscriptSentence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sentence_id', models.PositiveIntegerField()),
+                ('start', models.FloatField()),
+                ('end', models.FloatField()),
+                ('speaker', models.CharField(blank=True, max_length=50, null=True)),
+                ('visit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcript_sentences', to='visits.visit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='transcriptsentence',
+            constraint=models.UniqueConstraint(fields=('visit', 'sentence_id'), name='transcript_sentence_unique'),
+        ),
+        migrations.RunPython(populate_transcript_sentences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:18
+# ruff: noqa: RUF012
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcribe', '0004_transcript_sentence'),
+        ('visits', '0006_audio_blob_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('request', 'Request'), ('pipeline', 'Pipeline')], max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('duration', models.FloatField()),
+                ('stats_file', models.FileField(upload_to='profiles/')),
+                ('summary', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('visit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='profile_traces', to='visits.visit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['visit', 'created_at'], name='profile_visit_created_at_idx')],
+            },
+        ),
+    ]
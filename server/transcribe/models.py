@@ -5,15 +5,21 @@ from visits.models import Visit
 # Create your models here.
 
 
+STATUS_CHOICES = [
+    ("audio_processing_started", "Audio Processing Started"),
+    ("regenerate_soap_started", "Regenerate SOAP Started"),
+    ("transcription_complete", "Transcription Complete"),
+    ("details_extracted", "Details Extracted"),
+    ("text_generated", "Text Generated"),
+    ("completed", "Completed"),
+    ("error", "Error"),
+]
+
+
 class Polling(models.Model):
-    STATUS_CHOICES = [
-        ("audio_processing_started", "Audio Processing Started"),
-        ("transcription_complete", "Transcription Complete"),
-        ("details_extracted", "Details Extracted"),
-        ("text_generated", "Text Generated"),
-        ("completed", "Completed"),
-        ("error", "Error"),
-    ]
+    """Append-only log of pipeline events, pruned after a retention period."""
+
+    STATUS_CHOICES = STATUS_CHOICES
 
     visit = models.ForeignKey(Visit, on_delete=models.CASCADE, related_name="pollings")
     status = models.CharField(max_length=50, choices=STATUS_CHOICES)
@@ -23,5 +29,95 @@ class Polling(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["visit", "created_at"], name="polling_visit_created_at_idx"
+            ),
+        )
+
     def __str__(self):
         return f"Polling {self.id} - {self.status} for Visit {self.visit_id}"
+
+
+class PipelineState(models.Model):
+    """Current pipeline status of a visit, updated in place on every event."""
+
+    visit = models.OneToOneField(
+        Visit, on_delete=models.CASCADE, related_name="pipeline_state"
+    )
+    status = models.CharField(max_length=50, choices=STATUS_CHOICES, db_index=True)
+    # Statuses reached by the current run, in order
+    stages = models.JSONField(default=list)
+    progress = models.PositiveSmallIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    error = models.TextField(null=True, blank=True)
+    success = models.BooleanField(null=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"PipelineState {self.status} for Visit {self.visit_id}"
+
+
+class TranscriptSentence(models.Model):
+    """
+    Time index of a visit's transcript, one row per sentence.
+
+    Lets a SOAP reference be resolved to its place in the audio without
+    loading `Visit.transcript_json`.
+    """
+
+    visit = models.ForeignKey(
+        Visit, on_delete=models.CASCADE, related_name="transcript_sentences"
+    )
+    sentence_id = models.PositiveIntegerField()
+    start = models.FloatField()
+    end = models.FloatField()
+    # Raw speaker label from the transcript, before any speaker mapping
+    speaker = models.CharField(max_length=50, null=True, blank=True)
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=["visit", "sentence_id"], name="transcript_sentence_unique"
+            ),
+        )
+
+    def __str__(self):
+        return f"Sentence {self.sentence_id} ({self.start}-{self.end}) of Visit {self.visit_id}"
+
+
+class ProfileTrace(models.Model):
+    """A cProfile trace of an API request or a pipeline run."""
+
+    KIND_CHOICES = (
+        ("request", "Request"),
+        ("pipeline", "Pipeline"),
+    )
+
+    visit = models.ForeignKey(
+        Visit,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="profile_traces",
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Request method and path, or the pipeline function
+    name = models.CharField(max_length=255)
+    duration = models.FloatField()
+    # pstats dump, loadable with `pstats.Stats` or snakeviz
+    stats_file = models.FileField(upload_to="profiles/")
+    summary = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=["visit", "created_at"], name="profile_visit_created_at_idx"
+            ),
+        )
+
+    def __str__(self):
+        return f"ProfileTrace {self.kind} {self.name} ({self.duration:.3f}s)"
@@ -0,0 +1,119 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from visits.models import Visit
+
+from .models import ProfileTrace
+
+PROFILE_DIR = "profiles"
+
+logger = logging.getLogger(__name__)
+
+# The profiler running on each thread, if any
+_active = threading.local()
+
+
+def start_profiler() -> cProfile.Profile | None:
+    """
+    Start profiling the current thread, or return None when a profiler is
+    already active on it.
+
+    Concurrent async requests share the event loop thread. A second
+    profiler enabled there would silently replace the first on Python 3.11
+    (3.12+ refuses with ValueError), so only the first one runs and the
+    others go unprofiled. Stop it with `stop_profiler`.
+    """
+    if getattr(_active, "profiler", None) is not None:
+        logger.warning("Profiling skipped: another profile is active on this thread")
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        logger.warning(f"Profiling skipped: {e}")
+        return None
+    _active.profiler = profiler
+    return profiler
+
+
+def stop_profiler(profiler: cProfile.Profile):
+    """Stop a profiler from `start_profiler`, on the thread that started it."""
+    profiler.disable()
+    if getattr(_active, "profiler", None) is profiler:
+        _active.profiler = None
+
+
+def save_trace(
+    profiler: cProfile.Profile,
+    kind: str,
+    name: str,
+    duration: float,
+    visit_id: int | None = None,
+) -> ProfileTrace | None:
+    """Store a stopped profiler's stats, never failing the profiled work."""
+    try:
+        if visit_id is not None and not Visit.objects.filter(id=visit_id).exists():
+            visit_id = None
+
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(settings.PROFILING["summary_lines"])
+
+        name_on_disk = os.path.join(
+            PROFILE_DIR, str(visit_id or "requests"), f"{uuid.uuid4().hex}.prof"
+        )
+        path = default_storage.path(name_on_disk)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats.dump_stats(path)
+
+        return ProfileTrace.objects.create(
+            visit_id=visit_id,
+            kind=kind,
+            name=name[:255],
+            duration=duration,
+            stats_file=name_on_disk,
+            summary=summary.getvalue(),
+        )
+    except Exception:
+        logger.exception(f"Error saving {kind} profile of {name}")
+        return None
+
+
+@contextmanager
+def profiled(kind: str, name: str, visit_id: int | None = None, enabled=True):
+    """Profile the block and store the trace. A no-op unless `enabled`."""
+    profiler = start_profiler() if enabled else None
+    if profiler is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stop_profiler(profiler)
+        save_trace(profiler, kind, name, time.perf_counter() - start_time, visit_id)
+
+
+def serialize_trace(trace: ProfileTrace, summary: bool = False) -> dict:
+    data = {
+        "id": trace.id,
+        "visit_id": trace.visit_id,
+        "kind": trace.kind,
+        "name": trace.name,
+        "duration": trace.duration,
+        "created_at": trace.created_at.isoformat(),
+    }
+    if summary:
+        data["summary"] = trace.summary
+    return data
@@ -0,0 +1,218 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Priority classes for model calls. Lower values are admitted first."""
+
+    INTERACTIVE = 0  # clinician waiting on a regenerate
+    LIVE = 1  # freshly recorded visit going through the pipeline
+    BACKFILL = 2  # bulk ingestion of historical recordings
+
+
+class SchedulerRejected(Exception):
+    """Raised when a model call is refused because the backend is overloaded."""
+
+
+class SchedulerTimeout(SchedulerRejected):
+    """Raised when a model call waited longer than its priority class allows."""
+
+
+_current_priority = contextvars.ContextVar("model_priority", default=Priority.LIVE)
+
+
+@contextmanager
+def priority(value: Priority):
+    """Run every scheduled model call inside the block with the given priority."""
+    token = _current_priority.set(value)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+class ModelQueue:
+    """
+    Admission control for a single model backend.
+
+    At most `concurrency` calls run at once. Waiting calls are admitted in
+    priority order (FIFO within a class) and give up after the timeout of
+    their priority class. When the queue is already `max_queue_depth` deep, a
+    call evicts the newest waiter of a lower priority class, so interactive
+    calls are never turned away by a backlog of bulk work; without one it is
+    rejected outright.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue_depth: int, timeouts):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue_depth = max_queue_depth
+        self.timeouts = timeouts
+        self._lock = threading.Condition()
+        self._waiting = []
+        # Tickets of waiters pushed out of a full queue by a higher priority
+        self._evicted = set()
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._admitted = {p: 0 for p in Priority}
+        self._rejected = {p: 0 for p in Priority}
+        self._timed_out = {p: 0 for p in Priority}
+        self._wait_seconds = {p: 0.0 for p in Priority}
+
+    def _acquire(self, prio: Priority):
+        timeout = self.timeouts.get(prio)
+        enqueued_at = time.monotonic()
+        deadline = enqueued_at + timeout if timeout is not None else None
+
+        with self._lock:
+            if len(self._waiting) >= self.max_queue_depth:
+                # Lowest priority, most recently queued
+                victim = max(self._waiting, default=None)
+                if victim is None or victim[0] <= prio:
+                    self._rejected[prio] += 1
+                    logger.warning(f"Rejected {prio.name.lower()} {self.name} call")
+                    raise SchedulerRejected(
+                        f"{self.name} queue is full ({self.max_queue_depth} waiting)"
+                    )
+                self._waiting.remove(victim)
+                heapq.heapify(self._waiting)
+                self._evicted.add(victim)
+                self._lock.notify_all()
+
+            ticket = (int(prio), next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            while (
+                ticket in self._evicted
+                or self._waiting[0] != ticket
+                or self._in_flight >= self.concurrency
+            ):
+                if ticket in self._evicted:
+                    self._evicted.discard(ticket)
+                    self._rejected[prio] += 1
+                    logger.warning(
+                        f"Evicted {prio.name.lower()} {self.name} call from full queue"
+                    )
+                    raise SchedulerRejected(
+                        f"{self.name} queue is full, call evicted by a higher priority"
+                    )
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        heapq.heapify(self._waiting)
+                        self._timed_out[prio] += 1
+                        logger.warning(
+                            f"Timed out {prio.name.lower()} {self.name} call"
+                        )
+                        # The head of the queue may have changed
+                        self._lock.notify_all()
+                        raise SchedulerTimeout(
+                            f"{self.name} call timed out after {timeout:.0f}s in queue"
+                        )
+                self._lock.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self._admitted[prio] += 1
+            self._wait_seconds[prio] += time.monotonic() - enqueued_at
+            # Let the next waiter re-check whether a slot is still free
+            self._lock.notify_all()
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._lock.notify_all()
+
+    def run(self, fn, *args, prio: Priority | None = None, **kwargs):
+        prio = current_priority() if prio is None else prio
+        self._acquire(prio)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = {p.name.lower(): 0 for p in Priority}
+            for prio, _ in self._waiting:
+                depth[Priority(prio).name.lower()] += 1
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._waiting),
+                "queue_depth_by_priority": depth,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": {p.name.lower(): n for p, n in self._admitted.items()},
+                "rejected": {p.name.lower(): n for p, n in self._rejected.items()},
+                "timed_out": {p.name.lower(): n for p, n in self._timed_out.items()},
+                "avg_wait_seconds": {
+                    p.name.lower(): (
+                        self._wait_seconds[p] / self._admitted[p]
+                        if self._admitted[p]
+                        else 0.0
+                    )
+                    for p in Priority
+                },
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(model: str) -> ModelQueue:
+    with _queues_lock:
+        queue = _queues.get(model)
+        if queue is None:
+            config = settings.MODEL_SCHEDULER
+            queue = ModelQueue(
+                model,
+                concurrency=config["concurrency"].get(model, 1),
+                max_queue_depth=config["max_queue_depth"],
+                timeouts={
+                    Priority[k.upper()]: v for k, v in config["timeouts"].items()
+                },
+            )
+            _queues[model] = queue
+        return queue
+
+
+def run(model: str, fn, *args, **kwargs):
+    """Run `fn` once the scheduler admits a call to `model`."""
+    return get_queue(model).run(fn, *args, **kwargs)
+
+
+def stats() -> dict:
+    with _queues_lock:
+        queues = list(_queues.values())
+    return {queue.name: queue.stats() for queue in queues}
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that routes every call through the scheduler."""
+
+    def __init__(self, embeddings: Embeddings, model: str = "embeddings"):
+        self.embeddings = embeddings
+        self.model = model
+
+    def embed_documents(self, texts):
+        return run(self.model, self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text):
+        return run(self.model, self.embeddings.embed_query, text)
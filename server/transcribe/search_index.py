@@ -0,0 +1,161 @@
+import logging
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from langchain_community.vectorstores import Chroma
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "visit_search"
+SOAP_SECTIONS = ["subjective", "objective", "assessment", "plan"]
+
+# Deep pages of an ANN query get expensive; past this point callers should
+# narrow the query with filters instead
+MAX_RESULTS = 1000
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_search_store() -> Chroma:
+    """Shared index over every visit's transcript sentences and final SOAP notes."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            from .tasks import embeddings
+
+            _store = Chroma(
+                collection_name=COLLECTION_NAME,
+                embedding_function=embeddings,
+                persist_directory=str(settings.CHROMA_SEARCH_DIR),
+                collection_metadata={"hnsw:space": "cosine"},
+            )
+        return _store
+
+
+def _visit_metadata(visit, kind: str) -> dict:
+    return {
+        "visit_id": visit.id,
+        "visit_created_at": int(visit.created_at.timestamp()),
+        "kind": kind,
+    }
+
+
+def _delete_stale(store: Chroma, where: dict, keep_ids: set):
+    existing = store.get(where=where, include=[])["ids"]
+    stale = [doc_id for doc_id in existing if doc_id not in keep_ids]
+    if stale:
+        store.delete(ids=stale)
+
+
+def index_visit_transcript(visit, vectorstore: Chroma):
+    """
+    Upsert a visit's sentences into the shared index.
+
+    Embeddings are copied from the visit's own index so sentences are not
+    embedded twice.
+    """
+    store = get_search_store()
+    data = vectorstore.get(include=["embeddings", "documents", "metadatas"])
+    ids = []
+    metadatas = []
+    for metadata in data["metadatas"]:
+        ids.append(f"sentence:{visit.id}:{metadata['sentence_id']}")
+        metadatas.append({**metadata, **_visit_metadata(visit, "sentence")})
+
+    if ids:
+        store._collection.upsert(
+            ids=ids,
+            embeddings=data["embeddings"],
+            documents=data["documents"],
+            metadatas=metadatas,
+        )
+    _delete_stale(
+        store, {"$and": [{"visit_id": visit.id}, {"kind": "sentence"}]}, set(ids)
+    )
+
+
+def index_final_soap(visit):
+    """Upsert the clinician-approved SOAP note sections of a visit."""
+    store = get_search_store()
+    soap_note = visit.final_soap_note or {}
+    ids = []
+    texts = []
+    metadatas = []
+    for section in SOAP_SECTIONS:
+        text = soap_note.get(section)
+        if isinstance(text, dict):
+            text = text.get("text")
+        if not text:
+            continue
+        ids.append(f"soap:{visit.id}:{section}")
+        texts.append(text)
+        metadatas.append({**_visit_metadata(visit, "soap"), "section": section})
+
+    if ids:
+        store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+    _delete_stale(store, {"$and": [{"visit_id": visit.id}, {"kind": "soap"}]}, set(ids))
+
+
+def remove_visit(visit_id: int):
+    store = get_search_store()
+    _delete_stale(store, {"visit_id": visit_id}, set())
+
+
+def search(
+    query: str,
+    visit_id: int | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    speaker: str | None = None,
+    kind: str | None = None,
+    page: int = 1,
+    page_size: int = 20,
+) -> dict:
+    clauses = []
+    if visit_id is not None:
+        clauses.append({"visit_id": visit_id})
+    if created_from is not None:
+        clauses.append({"visit_created_at": {"$gte": int(created_from.timestamp())}})
+    if created_to is not None:
+        clauses.append({"visit_created_at": {"$lte": int(created_to.timestamp())}})
+    if speaker:
+        clauses.append({"speaker": speaker})
+    if kind:
+        clauses.append({"kind": kind})
+
+    where = None
+    if len(clauses) == 1:
+        where = clauses[0]
+    elif clauses:
+        where = {"$and": clauses}
+
+    offset = (page - 1) * page_size
+    if offset + page_size > MAX_RESULTS:
+        raise ValueError(
+            f"Only the first {MAX_RESULTS} results can be paged through, "
+            "narrow the query with filters"
+        )
+    # One extra hit tells us whether there is a next page
+    k = min(offset + page_size + 1, MAX_RESULTS)
+    hits = get_search_store().similarity_search_with_score(query, k=k, filter=where)
+
+    results = [
+        {
+            "id": f"{doc.metadata['kind']}:{doc.metadata['visit_id']}:"
+            + str(doc.metadata.get("sentence_id", doc.metadata.get("section"))),
+            "text": doc.page_content,
+            "score": 1 - distance,
+            **doc.metadata,
+        }
+        for doc, distance in hits[offset : offset + page_size]
+    ]
+    return {
+        "results": results,
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(hits) > offset + page_size,
+        # The last page of the result window: more hits may exist beyond it
+        "truncated": len(hits) >= MAX_RESULTS and len(hits) <= offset + page_size,
+    }
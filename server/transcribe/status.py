@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from visits.models import Visit
+
+from .models import PipelineState, Polling
+
+# Statuses that begin a new pipeline run and reset the visit's stages
+RUN_START_STATUSES = {"audio_processing_started", "regenerate_soap_started"}
+
+STAGE_PROGRESS = {
+    "audio_processing_started": 5,
+    "regenerate_soap_started": 40,
+    "transcription_complete": 40,
+    "details_extracted": 60,
+    "text_generated": 90,
+    "completed": 100,
+}
+
+PRUNE_BATCH_SIZE = 1000
+
+
+def record_status(
+    visit: Visit,
+    status: str,
+    completed: bool = False,
+    success: bool | None = None,
+    error: str | None = None,
+) -> PipelineState:
+    """
+    Record a pipeline event for a visit.
+
+    The event is appended to the Polling log and the visit's single
+    PipelineState row is updated in place, so reading the current status
+    never has to scan the log.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        Polling.objects.create(
+            visit=visit,
+            status=status,
+            completed=completed,
+            success=success,
+            error=error,
+            created_at=now,
+        )
+
+        state, _ = PipelineState.objects.select_for_update().get_or_create(
+            visit=visit, defaults={"status": status, "started_at": now}
+        )
+        if status in RUN_START_STATUSES:
+            state.stages = []
+            state.progress = 0
+            state.started_at = now
+        if status not in state.stages:
+            state.stages = [*state.stages, status]
+        state.status = status
+        state.progress = STAGE_PROGRESS.get(status, state.progress)
+        state.completed = completed
+        state.success = success
+        state.error = error
+        state.save()
+
+    return state
+
+
+def serialize_state(state: PipelineState | None) -> dict | None:
+    if state is None:
+        return None
+    return {
+        "status": state.status,
+        "stages": state.stages,
+        "progress": state.progress,
+        "completed": state.completed,
+        "success": state.success,
+        "error": state.error,
+        "started_at": state.started_at.isoformat(),
+        "updated_at": state.updated_at.isoformat(),
+    }
+
+
+def prune_events(retention_days: int | None = None) -> int:
+    """Delete Polling events older than the retention period, in batches."""
+    if retention_days is None:
+        retention_days = settings.PIPELINE_EVENT_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+
+    deleted = 0
+    while True:
+        ids = list(
+            Polling.objects.filter(created_at__lt=cutoff).values_list("id", flat=True)[
+                :PRUNE_BATCH_SIZE
+            ]
+        )
+        if not ids:
+            return deleted
+        deleted += Polling.objects.filter(id__in=ids).delete()[0]
@@ -1,16 +1,25 @@
 from .models import Visit
+from django.conf import settings
 from threading import Thread
-from .models import Polling
+from .status import record_status
 from django.db import transaction
 import logging
-from .helpers import get_transcript_from_deepgram, preprocess_transcript
+from .helpers import get_transcript_from_deepgram
+from .indexes import get_or_build_index, index_key
+from .timeline import index_sentence_times
+from .classify import SECTION_PROTOTYPES, classify_sentences
+from . import search_index
+from . import scheduler
+from .profiling import profiled
+from .scheduler import Priority, ScheduledEmbeddings
 from langchain_community.vectorstores import Chroma
+import chromadb
 from langchain_community.embeddings import OllamaEmbeddings
 from langchain.prompts import ChatPromptTemplate
 from langchain_ollama.llms import OllamaLLM
 # from langchain_google_genai import ChatGoogleGenerativeAI
 
-embeddings = OllamaEmbeddings(model="all-minilm")
+embeddings = ScheduledEmbeddings(OllamaEmbeddings(model="all-minilm"))
 llm = OllamaLLM(model="llama3")
 
 # llm = ChatGoogleGenerativeAI(
@@ -21,23 +30,39 @@ llm = OllamaLLM(model="llama3")
 logger = logging.getLogger(__name__)
 
 
+def _transcript_of_same_audio(visit: Visit):
+    """Another visit whose identical audio has already been transcribed."""
+    if not visit.audio_sha256:
+        return None
+    return (
+        Visit.objects.filter(
+            audio_sha256=visit.audio_sha256, transcript_json__isnull=False
+        )
+        .exclude(id=visit.id)
+        .only("transcript_text", "transcript_json")
+        .first()
+    )
+
+
 def transcription_task(visit: Visit):
-    # Initial transcription
-    with transaction.atomic():
+    # Initial transcription. The Deepgram call stays outside the transaction:
+    # SQLite would hold its lock for the whole request and block writers.
+    cached = _transcript_of_same_audio(visit)
+    if cached is not None:
+        visit.transcript_text = cached.transcript_text
+        visit.transcript_json = {"sentences": cached.transcript_json["sentences"]}
+    else:
         audio_file_path = visit.audio_file.path
-        transcript_data = get_transcript_from_deepgram(audio_file_path)
-        visit.transcript_text = (
-            transcript_data.get("results", {})
-            .get("channels", [{}])[0]
-            .get("alternatives", [{}])[0]
-            .get("transcript", "")
-        )
-        transcript_json = preprocess_transcript(transcript_data)
+        transcript_text, transcript_json = get_transcript_from_deepgram(audio_file_path)
+        visit.transcript_text = transcript_text
         visit.transcript_json = transcript_json
+
+    with transaction.atomic():
         visit.save()
+        index_sentence_times(visit)
 
-        Polling.objects.create(
-            visit=visit,
+        record_status(
+            visit,
             status="transcription_complete",
             completed=True,
             success=True,
@@ -71,17 +96,30 @@ def create_embeddings(visit: Visit):
             }
         )
 
-    persist_dir = f"./chromadb_transcripts/visit_{visit.id}"
-    vectorstore = Chroma.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        metadatas=metadata,
-        persist_directory=persist_dir,
+    def open_index(persist_dir):
+        return Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+
+    def build_index(persist_dir):
+        # Closed before the directory is renamed into place, so no handles
+        # to the temporary path outlive the build
+        client = chromadb.PersistentClient(path=persist_dir)
+        try:
+            vectorstore = Chroma.from_texts(
+                texts=texts,
+                embedding=embeddings,
+                metadatas=metadata,
+                client=client,
+            )
+            search_index.index_visit_transcript(visit, vectorstore)
+        finally:
+            client.close()
+
+    # Unchanged transcripts (and speaker mappings) reuse the existing index
+    # instead of appending duplicate documents to it
+    return get_or_build_index(
+        visit.id, index_key(texts, metadata), open_index, build_index
     )
 
-    vectorstore.persist()
-    return vectorstore
-
 
 def retrieve_relevant_sentences(query, vectorstore, top_k=5):
     docs = vectorstore.similarity_search(query, k=top_k)
@@ -90,49 +128,39 @@ def retrieve_relevant_sentences(query, vectorstore, top_k=5):
             "sentence_id": doc.metadata["sentence_id"],
             "sentence_text": doc.page_content,
             "speaker": doc.metadata["speaker"],
+            "start": doc.metadata.get("start"),
+            "end": doc.metadata.get("end"),
         }
         for doc in docs
     ]
 
 
+def retrieve_section_sentences(vectorstore):
+    # Each section's first prototype phrase is its query
+    return {
+        section: retrieve_relevant_sentences(phrases[0], vectorstore)
+        for section, phrases in SECTION_PROTOTYPES.items()
+    }
+
+
 def perform_rag(visit: Visit):
     # Detail extraction
     with transaction.atomic():
         vectorstore = create_embeddings(visit)
 
-        # S
-        query_subjective = "patient symptoms or health concerns or pain or discomfort"
-        subjective_sentences = retrieve_relevant_sentences(
-            query_subjective, vectorstore
-        )
+        if settings.SOAP_EXTRACTION["mode"] == "prototype":
+            details, dropped = classify_sentences(vectorstore)
+        else:
+            details, dropped = retrieve_section_sentences(vectorstore), {}
 
-        # O
-        query_objective = "objective findings"
-        objective_sentences = retrieve_relevant_sentences(query_objective, vectorstore)
-
-        # A
-        query_assessment = "assessment or diagnosis"
-        assessment_sentences = retrieve_relevant_sentences(
-            query_assessment, vectorstore
-        )
-
-        # P
-        query_plan = "treatment plan or recommendations"
-        plan_sentences = retrieve_relevant_sentences(query_plan, vectorstore)
-
-        Polling.objects.create(
-            visit=visit,
+        record_status(
+            visit,
             status="details_extracted",
             completed=True,
             success=True,
         )
 
-        return {
-            "subjective": subjective_sentences,
-            "objective": objective_sentences,
-            "assessment": assessment_sentences,
-            "plan": plan_sentences,
-        }
+        return details, dropped
 
 
 def generate_section(section_name, sentences):
@@ -154,45 +182,55 @@ def generate_section(section_name, sentences):
     """)
 
     chain = prompt_template | llm
-    response = chain.invoke({})
+    response = scheduler.run("llm", chain.invoke, {})
     return response
 
 
-def generate_soap(visit: Visit, raw_details: dict):
+def _references(items):
+    return [
+        {
+            "sentence_id": item.get("sentence_id"),
+            "start": item.get("start"),
+            "end": item.get("end"),
+        }
+        for item in items
+    ]
+
+
+def generate_soap(visit: Visit, raw_details: dict, dropped: dict | None = None):
+    # Sentences the extraction cap left out, surfaced with each section
+    dropped = dropped or {}
     with transaction.atomic():
         subjective_raw = raw_details.get("subjective", [])
         subjective_draft = generate_section("Subjective", subjective_raw)
         subjective = {
             "text": subjective_draft,
-            "references": [
-                {
-                    "sentence_id": item.get("sentence_id"),
-                    "start": item.get("start"),
-                    "end": item.get("end"),
-                }
-                for item in subjective_raw
-            ],
+            "references": _references(subjective_raw),
+            "dropped_references": dropped.get("subjective", 0),
         }
 
         objective_raw = raw_details.get("objective", [])
         objective_draft = generate_section("Objective", objective_raw)
         objective = {
             "text": objective_draft,
-            "references": [item.get("sentence_id") for item in objective_raw],
+            "references": _references(objective_raw),
+            "dropped_references": dropped.get("objective", 0),
         }
 
         assessment_raw = raw_details.get("assessment", [])
         assessment_draft = generate_section("Assessment", assessment_raw)
         assessment = {
             "text": assessment_draft,
-            "references": [item.get("sentence_id") for item in assessment_raw],
+            "references": _references(assessment_raw),
+            "dropped_references": dropped.get("assessment", 0),
         }
 
         plan_raw = raw_details.get("plan", [])
         plan_draft = generate_section("Plan", plan_raw)
         plan = {
             "text": plan_draft,
-            "references": [item.get("sentence_id") for item in plan_raw],
+            "references": _references(plan_raw),
+            "dropped_references": dropped.get("plan", 0),
         }
 
         soap_draft = {
@@ -205,32 +243,47 @@ def generate_soap(visit: Visit, raw_details: dict):
         visit.draft_soap_note = soap_draft
         visit.save()
 
-        Polling.objects.create(
-            visit=visit,
+        record_status(
+            visit,
             status="text_generated",
             completed=False,
             success=False,
         )
 
 
-def process_transcription(visit: Visit):
-    try:
-        Polling.objects.create(visit=visit, status="audio_processing_started")
+def _profile_pipeline(profile: bool | None) -> bool:
+    return settings.PROFILING["pipeline"] if profile is None else profile
 
-        transcription_task(visit)
-        raw_details = perform_rag(visit)
-        generate_soap(visit, raw_details)
 
-        Polling.objects.create(
-            visit=visit,
+def process_transcription(
+    visit: Visit, priority: Priority = Priority.LIVE, profile: bool | None = None
+):
+    try:
+        record_status(visit, status="audio_processing_started")
+
+        with (
+            profiled(
+                "pipeline",
+                "process_transcription",
+                visit.id,
+                enabled=_profile_pipeline(profile),
+            ),
+            scheduler.priority(priority),
+        ):
+            transcription_task(visit)
+            raw_details, dropped = perform_rag(visit)
+            generate_soap(visit, raw_details, dropped)
+
+        record_status(
+            visit,
             status="completed",
             completed=True,
             success=True,
         )
 
     except Exception as e:
-        Polling.objects.create(
-            visit=visit,
+        record_status(
+            visit,
             status="error",
             error=str(e),
             completed=True,
@@ -244,23 +297,32 @@ def transcribe_audio(visit: Visit):
     thread.start()
 
 
-def process_regenerate(visit: Visit):
+def process_regenerate(
+    visit: Visit, priority: Priority = Priority.INTERACTIVE, profile: bool | None = None
+):
     try:
-        Polling.objects.create(visit=visit, status="regenerate_soap_started")
-
-        raw_details = perform_rag(visit)
-        generate_soap(visit, raw_details)
-
-        Polling.objects.create(
-            visit=visit,
+        with (
+            profiled(
+                "pipeline",
+                "process_regenerate",
+                visit.id,
+                enabled=_profile_pipeline(profile),
+            ),
+            scheduler.priority(priority),
+        ):
+            raw_details, dropped = perform_rag(visit)
+            generate_soap(visit, raw_details, dropped)
+
+        record_status(
+            visit,
             status="completed",
             completed=True,
             success=True,
         )
 
     except Exception as e:
-        Polling.objects.create(
-            visit=visit,
+        record_status(
+            visit,
             status="error",
             error=str(e),
             completed=True,
@@ -269,6 +331,23 @@ def process_regenerate(visit: Visit):
 
 
 def regenerate_soap(visit: Visit):
+    # Recorded before the thread starts so a status read right after the
+    # request never sees the previous run's "completed"
+    record_status(visit, status="regenerate_soap_started")
+
     thread = Thread(target=process_regenerate, args=(visit,))
     thread.daemon = True
     thread.start()
+
+
+def process_final_soap_indexing(visit: Visit):
+    try:
+        search_index.index_final_soap(visit)
+    except Exception:
+        logger.exception(f"Error indexing final SOAP note for visit {visit.id}")
+
+
+def index_final_soap(visit: Visit):
+    thread = Thread(target=process_final_soap_indexing, args=(visit,))
+    thread.daemon = True
+    thread.start()
@@ -1,3 +1,963 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from typing import ClassVar
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from chromadb.api.shared_system_client import SharedSystemClient
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from transcribe import search_index
+from transcribe.classify import SECTION_PROTOTYPES, assign_sections, classify_sentences
+from transcribe.helpers import (
+    get_transcript_from_deepgram,
+    parse_transcript,
+    preprocess_transcript,
+)
+from transcribe.indexes import (
+    TMP_PREFIX,
+    get_or_build_index,
+    release_index,
+    visit_index_root,
+)
+from transcribe.models import (
+    PipelineState,
+    Polling,
+    ProfileTrace,
+    TranscriptSentence,
+)
+from transcribe.profiling import start_profiler, stop_profiler
+from transcribe.scheduler import (
+    ModelQueue,
+    Priority,
+    SchedulerRejected,
+    SchedulerTimeout,
+)
+from transcribe.status import prune_events, record_status
+from transcribe.tasks import (
+    create_embeddings,
+    process_transcription,
+    retrieve_section_sentences,
+)
+from visits.models import Visit
+from visits.testing import TempMediaRootMixin
+
+
+class RecordStatusTests(TestCase):
+    def setUp(self):
+        self.visit = Visit.objects.create()
+
+    def test_updates_single_state_row_in_place(self):
+        record_status(self.visit, status="audio_processing_started")
+        record_status(self.visit, status="transcription_complete", completed=True)
+        record_status(self.visit, status="completed", completed=True, success=True)
+
+        state = PipelineState.objects.get(visit=self.visit)
+        self.assertEqual(PipelineState.objects.count(), 1)
+        self.assertEqual(state.status, "completed")
+        self.assertEqual(state.progress, 100)
+        self.assertTrue(state.success)
+        self.assertEqual(
+            state.stages,
+            ["audio_processing_started", "transcription_complete", "completed"],
+        )
+        self.assertEqual(self.visit.pollings.count(), 3)
+
+    def test_new_run_resets_stages_and_keeps_event_log(self):
+        record_status(self.visit, status="audio_processing_started")
+        record_status(self.visit, status="completed", completed=True, success=True)
+        record_status(self.visit, status="regenerate_soap_started")
+
+        state = PipelineState.objects.get(visit=self.visit)
+        self.assertEqual(state.stages, ["regenerate_soap_started"])
+        self.assertEqual(state.progress, 40)
+        self.assertIsNone(state.success)
+        self.assertEqual(self.visit.pollings.count(), 3)
+
+    def test_error_keeps_progress(self):
+        record_status(self.visit, status="audio_processing_started")
+        record_status(self.visit, status="transcription_complete", completed=True)
+        record_status(
+            self.visit, status="error", error="boom", completed=True, success=False
+        )
+
+        state = PipelineState.objects.get(visit=self.visit)
+        self.assertEqual(state.status, "error")
+        self.assertEqual(state.error, "boom")
+        self.assertEqual(state.progress, 40)
+
+    def test_prune_events_keeps_state(self):
+        record_status(self.visit, status="audio_processing_started")
+        record_status(self.visit, status="completed", completed=True, success=True)
+        Polling.objects.update(created_at=timezone.now() - timedelta(days=31))
+        record_status(self.visit, status="regenerate_soap_started")
+
+        self.assertEqual(prune_events(retention_days=30), 2)
+        self.assertEqual(Polling.objects.count(), 1)
+        self.assertEqual(
+            PipelineState.objects.get(visit=self.visit).status,
+            "regenerate_soap_started",
+        )
+
+
+def _word(word, speaker, start):
+    return {
+        "word": word.lower().strip(".,"),
+        "punctuated_word": word,
+        "start": start,
+        "end": start + 0.5,
+        "speaker": speaker,
+    }
+
+
+DEEPGRAM_RESPONSE = {
+    "metadata": {"request_id": "abc"},
+    "results": {
+        "channels": [
+            {
+                "alternatives": [
+                    {
+                        "transcript": "How are you? Not great, my knee hurts.",
+                        "confidence": 0.9,
+                        "words": [
+                            _word("How", 0, 0.0),
+                            _word("are", 0, 0.5),
+                            _word("you?", 0, 1.0),
+                            _word("Not", 1, 1.5),
+                            _word("great,", 1, 2.0),
+                            _word("my", 1, 2.5),
+                            _word("knee", 1, 3.0),
+                            _word("hurts.", 1, 3.5),
+                        ],
+                    },
+                    {"transcript": "other", "words": [_word("other", 2, 0.0)]},
+                ]
+            },
+            {"alternatives": [{"transcript": "x", "words": [_word("x", 3, 0.0)]}]},
+        ]
+    },
+}
+
+
+class IndexSentenceTimesCommandTests(TestCase):
+    def _visit(self, *times):
+        return Visit.objects.create(
+            transcript_json={
+                "sentences": [
+                    {"sentence_id": i, "sentence": "...", "start": start, "end": end}
+                    for i, (start, end) in enumerate(times)
+                ]
+            }
+        )
+
+    def test_indexes_only_visits_without_sentence_times(self):
+        # Transcribed before the index existed
+        old = self._visit((0.0, 1.5), (1.5, 4.0))
+        indexed = self._visit((0.0, 2.0))
+        TranscriptSentence.objects.create(visit=indexed, sentence_id=0, start=0, end=1)
+        Visit.objects.create()
+
+        out = io.StringIO()
+        call_command("index_sentence_times", stdout=out)
+
+        self.assertIn("Indexed 1 visits (0 failed)", out.getvalue())
+        self.assertEqual(
+            list(
+                old.transcript_sentences.order_by("sentence_id").values_list(
+                    "start", "end"
+                )
+            ),
+            [(0.0, 1.5), (1.5, 4.0)],
+        )
+        self.assertEqual(indexed.transcript_sentences.get().end, 1)
+
+        call_command("index_sentence_times", "--all", stdout=io.StringIO())
+        self.assertEqual(indexed.transcript_sentences.get().end, 2.0)
+
+    def test_malformed_transcript_does_not_stop_the_run(self):
+        Visit.objects.create(transcript_json={"sentences": [{"sentence_id": 0}]})
+        good = self._visit((0.0, 1.0))
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("index_sentence_times", stdout=out, stderr=err)
+
+        self.assertIn("Indexed 1 visits (1 failed)", out.getvalue())
+        self.assertIn("KeyError", err.getvalue())
+        self.assertEqual(good.transcript_sentences.count(), 1)
+
+
+class StreamingTranscriptTests(TestCase):
+    def test_matches_preprocess_transcript(self):
+        body = json.dumps(DEEPGRAM_RESPONSE).encode()
+
+        transcript_text, transcript_json = parse_transcript(io.BytesIO(body))
+
+        self.assertEqual(transcript_text, "How are you? Not great, my knee hurts.")
+        self.assertEqual(transcript_json, preprocess_transcript(DEEPGRAM_RESPONSE))
+        self.assertEqual(
+            [s["sentence"] for s in transcript_json["sentences"]],
+            ["How are you?", "Not great, my knee hurts."],
+        )
+
+    def test_response_is_spooled_to_cache(self):
+        body = json.dumps(DEEPGRAM_RESPONSE).encode()
+        response = mock.MagicMock(status_code=200, raw=io.BytesIO(body))
+        response.__enter__.return_value = response
+
+        with tempfile.TemporaryDirectory() as base_dir:
+            audio_path = os.path.join(base_dir, "visit.webm")
+            with open(audio_path, "wb") as f:
+                f.write(b"audio")
+
+            with (
+                override_settings(BASE_DIR=base_dir),
+                mock.patch.dict(os.environ, {"DEEPGRAM_API_KEY": "key"}),
+                mock.patch("transcribe.helpers.requests.post", return_value=response),
+            ):
+                transcript_text, transcript_json = get_transcript_from_deepgram(
+                    audio_path
+                )
+
+            with open(
+                os.path.join(base_dir, "transcript_cache", "visit.webm.json"), "rb"
+            ) as f:
+                self.assertEqual(f.read(), body)
+
+        self.assertEqual(len(transcript_json["sentences"]), 2)
+        self.assertTrue(transcript_text.startswith("How are you?"))
+
+
+@override_settings(
+    PROFILING={
+        "requests": True,
+        "header": "X-Profile",
+        "pipeline": False,
+        "summary_lines": 10,
+    }
+)
+class ProfilingTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.visit = Visit.objects.create()
+
+    def test_requests_are_only_profiled_on_request(self):
+        response = self.client.get(f"/rest/visits/{self.visit.id}/status")
+
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(ProfileTrace.objects.exists())
+
+    def test_profiled_request_is_stored_with_its_visit(self):
+        response = self.client.get(
+            f"/rest/visits/{self.visit.id}/status", headers={"X-Profile": "1"}
+        )
+
+        trace = ProfileTrace.objects.get(id=response["X-Profile-Id"])
+        self.assertEqual(trace.visit, self.visit)
+        self.assertEqual(trace.kind, "request")
+        self.assertEqual(trace.name, f"GET /rest/visits/{self.visit.id}/status")
+        self.assertIn("cumulative", trace.summary)
+        self.assertTrue(os.path.exists(trace.stats_file.path))
+
+    def test_one_profiler_per_thread(self):
+        first = start_profiler()
+        try:
+            self.assertIsNone(start_profiler())
+        finally:
+            stop_profiler(first)
+
+        second = start_profiler()
+        self.assertIsNotNone(second)
+        stop_profiler(second)
+
+    async def test_concurrent_async_requests_profile_one_at_a_time(self):
+        url = f"/rest/visits/{self.visit.id}"
+        responses = await asyncio.gather(
+            *(self.async_client.get(url, headers={"X-Profile": "1"}) for _ in range(3))
+        )
+
+        self.assertEqual([r.status_code for r in responses], [200] * 3)
+        traced = [r for r in responses if "X-Profile-Id" in r]
+        self.assertEqual(len(traced), 1)
+        self.assertEqual(await ProfileTrace.objects.acount(), 1)
+
+    def test_header_is_ignored_when_request_profiling_is_off(self):
+        with self.settings(PROFILING={**settings.PROFILING, "requests": False}):
+            self.client.get("/rest/health/live", headers={"X-Profile": "1"})
+
+        self.assertFalse(ProfileTrace.objects.exists())
+
+    def test_pipeline_run_profiled_per_job(self):
+        with (
+            mock.patch("transcribe.tasks.transcription_task"),
+            mock.patch("transcribe.tasks.perform_rag", return_value=({}, {})),
+            mock.patch("transcribe.tasks.generate_soap"),
+        ):
+            process_transcription(self.visit)
+            self.assertFalse(ProfileTrace.objects.exists())
+            process_transcription(self.visit, profile=True)
+
+        trace = ProfileTrace.objects.get()
+        self.assertEqual(
+            (trace.kind, trace.name), ("pipeline", "process_transcription")
+        )
+        self.assertEqual(trace.visit, self.visit)
+
+    def test_admin_endpoints_require_staff(self):
+        self.client.get("/rest/health/live", headers={"X-Profile": "1"})
+        trace = ProfileTrace.objects.get()
+
+        self.assertEqual(self.client.get("/rest/admin/profiles").status_code, 403)
+
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        listing = self.client.get("/rest/admin/profiles").json()["profiles"]
+        self.assertEqual([p["id"] for p in listing], [trace.id])
+        detail = self.client.get(f"/rest/admin/profiles/{trace.id}").json()
+        self.assertEqual(detail["summary"], trace.summary)
+        stats = self.client.get(f"/rest/admin/profiles/{trace.id}/stats")
+        self.assertEqual(stats.status_code, 200)
+        self.assertEqual(b"".join(stats.streaming_content), trace.stats_file.read())
+
+
+class SectionEmbeddings(Embeddings):
+    """Embeds prototype phrases and keyword sentences onto section axes."""
+
+    KEYWORDS: ClassVar[dict[str, int]] = {
+        "hurts": 0,
+        "pressure": 1,
+        "infection": 2,
+        "prescribe": 3,
+    }
+
+    def _embed(self, text):
+        vector = [0.0] * 5
+        for axis, phrases in enumerate(SECTION_PROTOTYPES.values()):
+            if text in phrases:
+                vector[axis] = 1.0
+        for keyword, axis in self.KEYWORDS.items():
+            if keyword in text:
+                vector[axis] = 1.0
+        if not any(vector):
+            vector[4] = 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class ClassifySentencesTests(TestCase):
+    def test_threshold_and_margin(self):
+        prototypes = np.eye(4)
+        sentences = np.array(
+            [
+                [1.0, 0.0, 0.0, 0.0],  # clearly subjective
+                [0.0, 0.0, 1.0, 0.98],  # assessment and plan
+                [0.2, 1.0, 0.0, 0.0],  # objective, a little subjective
+                [0.0, 0.0, 0.0, 0.0],  # no signal
+            ]
+        )
+
+        scores, mask = assign_sections(sentences, prototypes, 0.3, 0.05)
+
+        self.assertEqual(mask.tolist()[0], [True, False, False, False])
+        self.assertEqual(mask.tolist()[1], [False, False, True, True])
+        # Subjective clears neither the threshold nor the margin
+        self.assertEqual(mask.tolist()[2], [False, True, False, False])
+        self.assertFalse(mask[3].any())
+        self.assertEqual(scores.shape, (4, 4))
+
+    def test_every_sentence_is_scored(self):
+        texts = [
+            "Patient: It hurts when I walk.",
+            "Doctor: Your blood pressure is fine.",
+            "Doctor: Looks like an infection, I will prescribe antibiotics.",
+            "Patient: Thanks, see you.",
+        ] + [f"Patient: It hurts here too {i}." for i in range(8)]
+        vectorstore = Chroma.from_texts(
+            texts=texts,
+            embedding=SectionEmbeddings(),
+            metadatas=[
+                {
+                    "sentence_id": i,
+                    "speaker": text.split(":")[0],
+                    "start": i,
+                    "end": i + 1,
+                }
+                for i, text in enumerate(texts)
+            ],
+            collection_name="classify-test",
+        )
+        self.addCleanup(vectorstore.delete_collection)
+
+        details, dropped = classify_sentences(vectorstore, threshold=0.3, margin=0.05)
+
+        ids = {
+            section: [s["sentence_id"] for s in items]
+            for section, items in details.items()
+        }
+        # All nine matching sentences, where retrieval would keep five
+        self.assertEqual(ids["subjective"], [0, *range(4, 12)])
+        self.assertEqual(ids["objective"], [1])
+        self.assertEqual(ids["assessment"], [2])
+        self.assertEqual(ids["plan"], [2])
+        self.assertNotIn(3, {i for section in ids.values() for i in section})
+        self.assertEqual(details["objective"][0]["start"], 1)
+        self.assertEqual(set(dropped.values()), {0})
+
+    def test_sections_keep_best_scoring_sentences_up_to_the_cap(self):
+        texts = [
+            "Patient: It hurts.",
+            "Patient: It hurts and the pressure is high.",
+            "Patient: It hurts again.",
+        ]
+        vectorstore = Chroma.from_texts(
+            texts=texts,
+            embedding=SectionEmbeddings(),
+            metadatas=[
+                {"sentence_id": i, "speaker": "Patient"} for i in range(len(texts))
+            ],
+            collection_name="classify-cap-test",
+        )
+        self.addCleanup(vectorstore.delete_collection)
+
+        # Uncapped by default
+        details, dropped = classify_sentences(vectorstore, threshold=0.3, margin=0.5)
+        self.assertEqual([s["sentence_id"] for s in details["subjective"]], [0, 1, 2])
+        self.assertEqual(dropped["subjective"], 0)
+
+        with self.assertLogs("transcribe.classify", "WARNING") as logs:
+            details, dropped = classify_sentences(
+                vectorstore, threshold=0.3, margin=0.5, max_sentences=2
+            )
+
+        # The mixed sentence scores lower for subjective and is dropped there
+        self.assertEqual([s["sentence_id"] for s in details["subjective"]], [0, 2])
+        self.assertEqual([s["sentence_id"] for s in details["objective"]], [1])
+        self.assertEqual((dropped["subjective"], dropped["objective"]), (1, 0))
+        self.assertIn("Capped subjective at 2 sentences, dropped 1", logs.output[0])
+
+    def test_retrieval_queries_are_the_first_prototype_phrases(self):
+        with mock.patch("transcribe.tasks.retrieve_relevant_sentences") as retrieve:
+            retrieve.side_effect = lambda query, vectorstore: [query]
+            details = retrieve_section_sentences(None)
+
+        self.assertEqual(
+            details,
+            {section: [p[0]] for section, p in SECTION_PROTOTYPES.items()},
+        )
+
+
+class ModelQueueTests(TestCase):
+    def setUp(self):
+        self.releases = []
+
+    def tearDown(self):
+        # Before the cleanups join the waiting threads
+        for release in self.releases:
+            release.set()
+
+    def _queue(self, max_queue_depth=10, timeouts=None):
+        return ModelQueue(
+            "llm",
+            concurrency=1,
+            max_queue_depth=max_queue_depth,
+            timeouts=timeouts or {p: 5 for p in Priority},
+        )
+
+    def _occupy(self, queue):
+        """Hold the only slot until the returned event is set."""
+        release = threading.Event()
+        thread = threading.Thread(
+            target=queue.run, args=(release.wait,), kwargs={"prio": Priority.LIVE}
+        )
+        thread.start()
+        self._wait_for(lambda: queue.stats()["in_flight"] == 1)
+        self.addCleanup(thread.join)
+        self.releases.append(release)
+        return release
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def _submit(self, queue, prio, results):
+        def call():
+            try:
+                results.append(queue.run(lambda: prio, prio=prio))
+            except SchedulerRejected as e:
+                results.append(e)
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def test_admits_by_priority_then_fifo(self):
+        queue = self._queue()
+        release = self._occupy(queue)
+        results = []
+        for count, prio in enumerate(
+            [Priority.BACKFILL, Priority.LIVE, Priority.INTERACTIVE, Priority.LIVE],
+            start=1,
+        ):
+            self._submit(queue, prio, results)
+            self._wait_for(lambda depth=count: queue.stats()["queue_depth"] == depth)
+
+        release.set()
+        self._wait_for(lambda: len(results) == 4)
+
+        self.assertEqual(
+            results,
+            [Priority.INTERACTIVE, Priority.LIVE, Priority.LIVE, Priority.BACKFILL],
+        )
+
+    def test_waiter_times_out(self):
+        queue = self._queue(
+            timeouts={**{p: 5 for p in Priority}, Priority.BACKFILL: 0.05}
+        )
+        self._occupy(queue)
+
+        with self.assertRaises(SchedulerTimeout):
+            queue.run(lambda: None, prio=Priority.BACKFILL)
+        self.assertEqual(queue.stats()["timed_out"]["backfill"], 1)
+        self.assertEqual(queue.stats()["queue_depth"], 0)
+
+    def test_full_queue_rejects_equal_priority(self):
+        queue = self._queue(max_queue_depth=1)
+        self._occupy(queue)
+        self._submit(queue, Priority.LIVE, [])
+        self._wait_for(lambda: queue.stats()["queue_depth"] == 1)
+
+        with self.assertRaises(SchedulerRejected):
+            queue.run(lambda: None, prio=Priority.LIVE)
+        self.assertEqual(queue.stats()["rejected"]["live"], 1)
+
+    def test_full_queue_evicts_lower_priority_for_interactive(self):
+        queue = self._queue(max_queue_depth=2)
+        release = self._occupy(queue)
+        backfill_results, interactive_results = [], []
+        for _ in range(2):
+            self._submit(queue, Priority.BACKFILL, backfill_results)
+        self._wait_for(lambda: queue.stats()["queue_depth"] == 2)
+
+        self._submit(queue, Priority.INTERACTIVE, interactive_results)
+        # The newest backfill waiter gives up its place
+        self._wait_for(lambda: len(backfill_results) == 1)
+        self.assertIsInstance(backfill_results[0], SchedulerRejected)
+
+        release.set()
+        self._wait_for(lambda: len(backfill_results) == 2)
+        self.assertEqual(interactive_results, [Priority.INTERACTIVE])
+        self.assertEqual(backfill_results[1], Priority.BACKFILL)
+        self.assertEqual(queue.stats()["rejected"]["backfill"], 1)
+
+
+class BackfillVisitsTests(TempMediaRootMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.hashes = {}
+        for name in ("a.webm", "b.wav", "c.mp3"):
+            content = name.encode() * 100
+            with open(os.path.join(self.directory, name), "wb") as f:
+                f.write(content)
+            self.hashes[name] = hashlib.sha256(content).hexdigest()
+
+        self.failing = set()
+        patcher = mock.patch(
+            "transcribe.management.commands.backfill_visits.process_transcription",
+            side_effect=self._process,
+        )
+        self.process = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _process(self, visit, **kwargs):
+        record_status(visit, status="audio_processing_started")
+        if visit.audio_sha256 in self.failing:
+            record_status(
+                visit, status="error", error="boom", completed=True, success=False
+            )
+        else:
+            record_status(visit, status="completed", completed=True, success=True)
+
+    def _backfill(self):
+        out = io.StringIO()
+        call_command(
+            "backfill_visits",
+            self.directory,
+            # The in-memory test database allows one writer at a time
+            "--workers",
+            "1",
+            stdout=out,
+            stderr=io.StringIO(),
+        )
+        return out.getvalue()
+
+    def _processed_visit_ids(self):
+        return sorted(call.args[0].id for call in self.process.call_args_list)
+
+    def test_fresh_run_processes_every_file(self):
+        self._backfill()
+
+        visits = Visit.objects.order_by("id")
+        self.assertEqual(
+            sorted(v.audio_sha256 for v in visits), sorted(self.hashes.values())
+        )
+        self.assertTrue(all(v.source == "backfill" and v.audio_file for v in visits))
+        self.assertEqual(self._processed_visit_ids(), [v.id for v in visits])
+        self.assertEqual(PipelineState.objects.filter(status="completed").count(), 3)
+
+    def test_rerun_skips_completed_visits(self):
+        self._backfill()
+        output = self._backfill()
+
+        self.assertIn("3 already completed", output)
+        self.assertEqual(Visit.objects.count(), 3)
+        self.assertEqual(self.process.call_count, 3)
+
+    def test_rerun_resumes_failed_visits(self):
+        self.failing = {self.hashes["b.wav"]}
+        self._backfill()
+        failed = Visit.objects.get(audio_sha256=self.hashes["b.wav"])
+        self.assertEqual(failed.pipeline_state.status, "error")
+
+        self.failing = set()
+        self.process.reset_mock()
+        output = self._backfill()
+
+        self.assertIn("1 to resume, 0 new", output)
+        self.assertEqual(self._processed_visit_ids(), [failed.id])
+        self.assertEqual(Visit.objects.count(), 3)
+        failed.refresh_from_db()
+        self.assertEqual(failed.pipeline_state.status, "completed")
+
+    def test_only_idle_backfill_visits_are_resumed(self):
+        uploaded = Visit.objects.create(audio_sha256=self.hashes["a.webm"])
+        record_status(uploaded, status="error", completed=True, success=False)
+        running = Visit.objects.create(
+            audio_sha256=self.hashes["b.wav"], source="backfill"
+        )
+        record_status(running, status="transcription_complete")
+        interrupted = Visit.objects.create(
+            audio_sha256=self.hashes["c.mp3"], source="backfill"
+        )
+        record_status(interrupted, status="transcription_complete")
+        PipelineState.objects.filter(visit=interrupted).update(
+            updated_at=timezone.now() - timedelta(hours=2)
+        )
+
+        output = self._backfill()
+
+        self.assertIn("1 running", output)
+        created = Visit.objects.get(
+            source="backfill", audio_sha256=self.hashes["a.webm"]
+        )
+        self.assertEqual(
+            self._processed_visit_ids(), sorted([interrupted.id, created.id])
+        )
+        uploaded.refresh_from_db()
+        self.assertFalse(uploaded.audio_file)
+        self.assertEqual(uploaded.pipeline_state.status, "error")
+
+
+class VectorIndexTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(CHROMA_TRANSCRIPTS_DIR=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.builds = []
+
+    def _build(self, path):
+        self.builds.append(path)
+        os.makedirs(path)
+        with open(os.path.join(path, "chroma.sqlite3"), "w") as f:
+            f.write("index")
+
+    def _get(self, visit_id, key):
+        return get_or_build_index(visit_id, key, lambda path: path, self._build)
+
+    def _age(self, path, seconds):
+        past = time.time() - seconds
+        os.utime(path, (past, past))
+
+    def test_unchanged_transcript_reuses_index(self):
+        first = self._get(1, "a" * 32)
+        second = self._get(1, "a" * 32)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(os.listdir(visit_index_root(1)), ["a" * 32])
+
+    def test_changed_transcript_replaces_index(self):
+        self._get(1, "a" * 32)
+        path = self._get(1, "b" * 32)
+
+        self.assertEqual(len(self.builds), 2)
+        self.assertTrue(path.endswith("b" * 32))
+        # Built in a temporary directory, then renamed into place
+        self.assertTrue(os.path.basename(self.builds[1]).startswith(TMP_PREFIX))
+        self.assertEqual(os.listdir(visit_index_root(1)), ["b" * 32])
+
+    def test_build_removes_legacy_store(self):
+        root = visit_index_root(1)
+        os.makedirs(root / "0b6f7c3e-5d1a-4e8e-9b1c-2f1e5a7d9c40")
+        (root / "chroma.sqlite3").write_text("legacy")
+
+        self._get(1, "a" * 32)
+
+        self.assertEqual(os.listdir(root), ["a" * 32])
+
+    def test_rebuild_releases_chroma_systems(self):
+        visit = Visit.objects.create(
+            transcript_json={
+                "sentences": [
+                    {
+                        "sentence_id": 0,
+                        "sentence": "It hurts.",
+                        "speaker": 0,
+                        "start": 0.0,
+                        "end": 1.0,
+                    }
+                ]
+            }
+        )
+        with (
+            mock.patch("transcribe.tasks.embeddings", FakeEmbeddings(size=8)),
+            mock.patch("transcribe.search_index.index_visit_transcript"),
+        ):
+            create_embeddings(visit)
+            visit.transcript_json["sentences"][0]["sentence"] = "It still hurts."
+            create_embeddings(visit)
+
+        root = visit_index_root(visit.id)
+        (current,) = os.listdir(root)
+        self.addCleanup(release_index, root / current)
+        # Only the index opened for use is still cached; the temporary build
+        # directories and the replaced version hold no files open
+        cached = [
+            identifier
+            for identifier in SharedSystemClient._identifier_to_system
+            if identifier.startswith(str(root))
+        ]
+        self.assertEqual(cached, [str(root / current)])
+
+    def test_gc_classifies_index_directories(self):
+        deleted_id = Visit.objects.create().id
+        Visit.objects.filter(id=deleted_id).delete()
+        finalized = Visit.objects.create(final_soap_note={"plan": "rest"})
+        active = Visit.objects.create()
+
+        for visit_id in (deleted_id, finalized.id, active.id):
+            self._get(visit_id, "a" * 32)
+        root = visit_index_root(active.id)
+        old_version = root / ("a" * 32)
+        self._age(old_version, 600)
+        os.makedirs(root / ("b" * 32))
+        interrupted = root / f"{TMP_PREFIX}{'c' * 32}-0000"
+        os.makedirs(interrupted)
+        self._age(interrupted, 2 * 60 * 60)
+        in_progress = root / f"{TMP_PREFIX}{'d' * 32}-0000"
+        os.makedirs(in_progress)
+        (root / "chroma.sqlite3").write_text("legacy")
+
+        out = io.StringIO()
+        with mock.patch("transcribe.search_index.remove_visit") as remove_visit:
+            call_command("gc_vector_indexes", stdout=out)
+
+        output = out.getvalue()
+        self.assertIn(f"visit_{deleted_id}: visit deleted", output)
+        self.assertIn(f"visit_{finalized.id}: visit finalized", output)
+        self.assertIn("superseded version", output)
+        self.assertIn("interrupted build", output)
+        self.assertIn("chroma.sqlite3: legacy index", output)
+        remove_visit.assert_called_once_with(deleted_id)
+        self.assertFalse(visit_index_root(deleted_id).exists())
+        self.assertFalse(visit_index_root(finalized.id).exists())
+        self.assertEqual(sorted(os.listdir(root)), sorted(["b" * 32, in_progress.name]))
+
+
+class SearchPagingTests(TestCase):
+    def setUp(self):
+        hits = [
+            (Document(page_content=f"sentence {i}", metadata=self._metadata(i)), 0.1)
+            for i in range(search_index.MAX_RESULTS)
+        ]
+        store = mock.Mock()
+        store.similarity_search_with_score.side_effect = lambda query, k, filter: hits[
+            :k
+        ]
+        patcher = mock.patch(
+            "transcribe.search_index.get_search_store", return_value=store
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _metadata(self, i):
+        return {"kind": "sentence", "visit_id": 1, "sentence_id": i}
+
+    def test_last_page_of_window_is_flagged_truncated(self):
+        first = search_index.search("pain", page=1, page_size=100)
+        last = search_index.search("pain", page=10, page_size=100)
+
+        self.assertEqual((first["has_more"], first["truncated"]), (True, False))
+        self.assertEqual(len(last["results"]), 100)
+        self.assertEqual((last["has_more"], last["truncated"]), (False, True))
+
+    def test_pages_past_window_are_rejected(self):
+        response = self.client.get(
+            "/rest/search", {"q": "pain", "page": 11, "page_size": 100}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(ValueError):
+            search_index.search("pain", page=11, page_size=100)
+
+
+class TopicEmbeddings(Embeddings):
+    """Embeds texts onto one axis per topic word they mention."""
+
+    TOPICS = ("pain", "fever", "rest")
+
+    def _embed(self, text):
+        vector = [float(topic in text) for topic in self.TOPICS]
+        return [*vector, float(not any(vector))]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.store = Chroma(
+            collection_name=f"search-test-{self.id()}",
+            embedding_function=TopicEmbeddings(),
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+        self.addCleanup(self.store.delete_collection)
+        patcher = mock.patch(
+            "transcribe.search_index.get_search_store", return_value=self.store
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = timezone.now()
+        self.old_visit = Visit.objects.create(created_at=now - timedelta(days=30))
+        self.new_visit = Visit.objects.create(created_at=now)
+        self._index_transcript(
+            self.old_visit, ["Patient: knee pain", "Doctor: any fever?"]
+        )
+        self._index_transcript(
+            self.new_visit,
+            ["Patient: pain and fever", "Patient: pain", "Doctor: see you"],
+        )
+
+    def _index_transcript(self, visit, texts):
+        vectorstore = Chroma.from_texts(
+            texts=texts,
+            embedding=TopicEmbeddings(),
+            metadatas=[
+                {
+                    "sentence_id": i,
+                    "speaker": text.split(":")[0],
+                    "start": float(i),
+                    "end": float(i + 1),
+                }
+                for i, text in enumerate(texts)
+            ],
+            collection_name=f"visit-{visit.id}-{self.id()}",
+        )
+        try:
+            search_index.index_visit_transcript(visit, vectorstore)
+        finally:
+            vectorstore.delete_collection()
+
+    def _ids(self, **kwargs):
+        return [r["id"] for r in search_index.search("pain", **kwargs)["results"]]
+
+    def test_results_are_ordered_by_cosine_similarity(self):
+        results = search_index.search("pain", page_size=3)["results"]
+
+        self.assertEqual(
+            {r["id"] for r in results[:2]},
+            {f"sentence:{self.old_visit.id}:0", f"sentence:{self.new_visit.id}:1"},
+        )
+        self.assertAlmostEqual(results[0]["score"], 1.0, places=5)
+        self.assertAlmostEqual(results[1]["score"], 1.0, places=5)
+        # "pain and fever" is 45 degrees off the query
+        self.assertEqual(results[2]["id"], f"sentence:{self.new_visit.id}:0")
+        self.assertAlmostEqual(results[2]["score"], 2**-0.5, places=5)
+
+    def test_metadata_filters(self):
+        self.assertEqual(
+            set(self._ids(visit_id=self.old_visit.id, page_size=10)),
+            {f"sentence:{self.old_visit.id}:0", f"sentence:{self.old_visit.id}:1"},
+        )
+        recent = self._ids(
+            created_from=timezone.now() - timedelta(days=1), page_size=10
+        )
+        self.assertEqual({i.split(":")[1] for i in recent}, {str(self.new_visit.id)})
+        self.assertEqual(
+            self._ids(speaker="Doctor", created_to=timezone.now() - timedelta(days=1)),
+            [f"sentence:{self.old_visit.id}:1"],
+        )
+
+        self.new_visit.final_soap_note = {"subjective": "pain", "plan": "rest"}
+        search_index.index_final_soap(self.new_visit)
+        soap = search_index.search("pain", kind="soap")["results"]
+        self.assertEqual([r["section"] for r in soap], ["subjective", "plan"])
+        self.assertEqual(soap[0]["visit_id"], self.new_visit.id)
+
+    def test_reindexing_replaces_documents(self):
+        self._index_transcript(self.new_visit, ["Patient: pain", "Doctor: rest"])
+        self.new_visit.final_soap_note = {"subjective": "pain", "plan": "rest"}
+        search_index.index_final_soap(self.new_visit)
+        self.new_visit.final_soap_note = {"subjective": {"text": "less pain"}}
+        search_index.index_final_soap(self.new_visit)
+
+        ids = self.store.get(where={"visit_id": self.new_visit.id}, include=[])["ids"]
+        self.assertEqual(
+            sorted(ids),
+            sorted(
+                [
+                    f"sentence:{self.new_visit.id}:0",
+                    f"sentence:{self.new_visit.id}:1",
+                    f"soap:{self.new_visit.id}:subjective",
+                ]
+            ),
+        )
+        self.assertEqual(
+            self.store.get(ids=[f"soap:{self.new_visit.id}:subjective"])["documents"],
+            ["less pain"],
+        )
+
+        search_index.remove_visit(self.new_visit.id)
+        self.assertEqual(
+            self.store.get(where={"visit_id": self.new_visit.id}, include=[])["ids"],
+            [],
+        )
@@ -0,0 +1,73 @@
+import math
+
+from django.db.models import Max
+
+from visits.models import Visit
+
+from .models import TranscriptSentence
+
+
+def index_sentence_times(visit: Visit):
+    """Replace the visit's sentence time index with its current transcript."""
+    sentences = (visit.transcript_json or {}).get("sentences", [])
+    TranscriptSentence.objects.filter(visit=visit).delete()
+    TranscriptSentence.objects.bulk_create(
+        [
+            TranscriptSentence(
+                visit=visit,
+                sentence_id=sentence["sentence_id"],
+                start=sentence["start"],
+                end=sentence["end"],
+                speaker=None
+                if sentence.get("speaker") is None
+                else str(sentence["speaker"]),
+            )
+            for sentence in sentences
+        ],
+        batch_size=1000,
+    )
+
+
+def audio_size(visit: Visit) -> int | None:
+    if visit.audio_blob_id:
+        return visit.audio_blob.size
+    if visit.audio_file:
+        try:
+            return visit.audio_file.size
+        except OSError:
+            return None
+    return None
+
+
+def estimate_byte_range(
+    start: float, end: float, duration: float, size: int
+) -> dict | None:
+    """
+    Inclusive byte range holding [start, end] seconds, assuming a constant
+    bitrate. Good enough to prefetch around a sentence; players still seek
+    by time.
+    """
+    if not duration or not size:
+        return None
+    first = max(0, math.floor(size * start / duration))
+    last = min(size - 1, math.ceil(size * end / duration))
+    return {"start": first, "end": max(first, last)}
+
+
+def resolve_references(visit: Visit, sentence_ids: list[int] | None = None) -> list:
+    """Time (and estimated byte) ranges of the given sentences of a visit."""
+    sentences = TranscriptSentence.objects.filter(visit=visit)
+    duration = sentences.aggregate(duration=Max("end"))["duration"]
+    if sentence_ids is not None:
+        sentences = sentences.filter(sentence_id__in=sentence_ids)
+    size = audio_size(visit)
+
+    return [
+        {
+            **row,
+            "bytes": estimate_byte_range(row["start"], row["end"], duration, size),
+        }
+        for row in sentences.order_by("sentence_id").values(
+            "sentence_id", "start", "end", "speaker"
+        )
+    ]
@@ -0,0 +1,147 @@
+import mimetypes
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Browsers send these for recorded audio, mimetypes may not know them
+AUDIO_CONTENT_TYPES = {
+    ".webm": "audio/webm",
+    ".ogg": "audio/ogg",
+    ".m4a": "audio/mp4",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single `Range: bytes=...` header into an inclusive (first, last)
+    byte range of a `size` byte file.
+
+    Returns None when the whole file should be served: no header, a header
+    we do not understand, or several ranges (which we may legally ignore).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    first = int(first)
+    last = int(last) if last else size - 1
+    if first >= size or last < first:
+        raise RangeNotSatisfiable()
+    return first, min(last, size - 1)
+
+
+def _iter_file_range(path: str, first: int, last: int):
+    remaining = last - first + 1
+    with open(path, "rb") as f:
+        f.seek(first)
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _aiter_file_range(path: str, first: int, last: int):
+    """Async `_iter_file_range`, reading each chunk in a worker thread."""
+    f = await sync_to_async(open, thread_sensitive=False)(path, "rb")
+    try:
+        await sync_to_async(f.seek, thread_sensitive=False)(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = await sync_to_async(f.read, thread_sensitive=False)(
+                min(STREAM_CHUNK_SIZE, remaining)
+            )
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(f.close, thread_sensitive=False)()
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def audio_response(
+    request, path: str, etag: str, cache_control: str = "private, no-cache"
+):
+    """
+    Serve an audio file with Range (206), conditional (304) and caching
+    header support, so players can seek without downloading the whole
+    recording. The file is streamed in chunks under both WSGI and ASGI.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{etag}"'
+    content_type = (
+        AUDIO_CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+        or mimetypes.guess_type(path)[0]
+        or "application/octet-stream"
+    )
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": cache_control,
+    }
+
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        return HttpResponse(status=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("If-Range")
+    # A stale If-Range means the client's partial copy is outdated: send it all
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except RangeNotSatisfiable:
+            return HttpResponse(
+                status=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+    status = 206
+    if byte_range is None:
+        status = 200
+        byte_range = (0, size - 1)
+    else:
+        headers["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+    first, last = byte_range
+    headers["Content-Length"] = str(last - first + 1)
+
+    # Under ASGI a sync iterator would be read into memory before sending
+    if isinstance(request, ASGIRequest):
+        content = _aiter_file_range(path, first, last)
+    else:
+        content = _iter_file_range(path, first, last)
+    return StreamingHttpResponse(
+        content, status=status, content_type=content_type, headers=headers
+    )
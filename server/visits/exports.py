@@ -0,0 +1,88 @@
+import difflib
+import json
+
+from django.db.models import Q
+
+from .models import Visit
+from .pagination import decode_cursor, encode_cursor
+
+SOAP_SECTIONS = ["subjective", "objective", "assessment", "plan"]
+
+EXPORT_BATCH_SIZE = 500
+
+
+def _section_text(section) -> str:
+    # Draft sections are {"text", "references"}, final sections plain text
+    if isinstance(section, dict):
+        section = section.get("text")
+    return section or ""
+
+
+def section_diffs(draft_soap_note: dict | None, final_soap_note: dict | None) -> dict:
+    draft_soap_note = draft_soap_note or {}
+    final_soap_note = final_soap_note or {}
+    sections = {}
+    for name in SOAP_SECTIONS:
+        draft = _section_text(draft_soap_note.get(name))
+        final = _section_text(final_soap_note.get(name))
+        sections[name] = {
+            "draft": draft,
+            "final": final,
+            "changed": draft != final,
+            "diff": list(
+                difflib.unified_diff(
+                    draft.splitlines(),
+                    final.splitlines(),
+                    fromfile="draft",
+                    tofile="final",
+                    lineterm="",
+                )
+            ),
+        }
+    return sections
+
+
+def iter_feedback_records(
+    cursor: str | None = None, batch_size: int = EXPORT_BATCH_SIZE
+):
+    """
+    Yield one record per visit with clinician edits, oldest change first.
+
+    Visits are read in (updated_at, id) keyset order one batch at a time, so
+    memory stays constant however many visits there are. Each record carries
+    the cursor to resume after it.
+    """
+    queryset = (
+        Visit.objects.filter(final_soap_note__isnull=False)
+        .only("id", "draft_soap_note", "final_soap_note", "created_at", "updated_at")
+        .order_by("updated_at", "id")
+    )
+    after = decode_cursor(cursor) if cursor else None
+
+    while True:
+        batch = queryset
+        if after is not None:
+            updated_at, visit_id = after
+            batch = batch.filter(
+                Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=visit_id)
+            )
+
+        count = 0
+        for visit in batch[:batch_size].iterator(chunk_size=batch_size):
+            count += 1
+            after = (visit.updated_at, visit.id)
+            yield {
+                "visit_id": visit.id,
+                "created_at": visit.created_at.isoformat(),
+                "updated_at": visit.updated_at.isoformat(),
+                "sections": section_diffs(visit.draft_soap_note, visit.final_soap_note),
+                "cursor": encode_cursor(visit.updated_at, visit.id),
+            }
+
+        if count < batch_size:
+            return
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
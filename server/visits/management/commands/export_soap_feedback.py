@@ -0,0 +1,61 @@
+import json
+import os
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from visits.exports import iter_feedback_records
+from visits.pagination import InvalidCursor
+
+
+class Command(BaseCommand):
+    help = (
+        "Export clinician edits of draft SOAP notes as NDJSON with section "
+        "level diffs. With --cursor-file only visits edited since the previous "
+        "export are written, and the file is advanced once the export succeeds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            "-o",
+            default="-",
+            help="File to write to, '-' for stdout",
+        )
+        parser.add_argument(
+            "--cursor", help="Only export visits edited after this cursor"
+        )
+        parser.add_argument(
+            "--cursor-file",
+            type=Path,
+            help="Read the starting cursor from, and save the last cursor to, this file",
+        )
+
+    def handle(self, *args, **options):
+        cursor = options["cursor"]
+        cursor_file = options["cursor_file"]
+        if cursor is None and cursor_file and cursor_file.exists():
+            cursor = cursor_file.read_text().strip() or None
+
+        count = 0
+        try:
+            with self._open_output(options["output"]) as out:
+                for record in iter_feedback_records(cursor):
+                    out.write(json.dumps(record) + "\n")
+                    cursor = record["cursor"]
+                    count += 1
+        except InvalidCursor as e:
+            raise CommandError(str(e)) from e
+
+        if cursor_file and cursor:
+            tmp_file = cursor_file.with_suffix(cursor_file.suffix + ".tmp")
+            tmp_file.write_text(cursor)
+            os.replace(tmp_file, cursor_file)
+
+        self.stderr.write(f"Exported {count} visits")
+
+    def _open_output(self, output):
+        if output == "-":
+            return nullcontext(self.stdout)
+        return open(output, "w")
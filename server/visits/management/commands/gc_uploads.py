@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from visits.models import UploadSession
+from visits.storage import PART_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove resumable uploads that were abandoned before being finalized: "
+        "upload sessions that received no chunk within --max-age-hours, and "
+        "partial upload files no session refers to any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-hours",
+            type=int,
+            default=24,
+            help="Keep uploads that received data within this many hours",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be removed",
+        )
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options["max_age_hours"])
+        dry_run = options["dry_run"]
+        part_dir = Path(default_storage.path(PART_DIR))
+
+        # Every chunk bumps updated_at, so these have been idle for the window
+        expired = UploadSession.objects.filter(
+            status="uploading", updated_at__lt=timezone.now() - max_age
+        )
+        expired_ids = [
+            str(upload_id) for upload_id in expired.values_list("id", flat=True)
+        ]
+        for upload_id in expired_ids:
+            self.stdout.write(f"{upload_id}: upload expired")
+        if not dry_run:
+            expired.filter(id__in=expired_ids).delete()
+
+        removals = [part_dir / f"{upload_id}.part" for upload_id in expired_ids]
+        if part_dir.is_dir():
+            live = {
+                str(upload_id)
+                for upload_id in UploadSession.objects.filter(
+                    status="uploading"
+                ).values_list("id", flat=True)
+            }
+            cutoff = time.time() - max_age.total_seconds()
+            for path in part_dir.glob("*.part"):
+                if (
+                    path.stem not in live
+                    and path not in removals
+                    and path.stat().st_mtime < cutoff
+                ):
+                    self.stdout.write(f"{path.name}: orphaned part")
+                    removals.append(path)
+
+        reclaimed = 0
+        failed = 0
+        for path in removals:
+            try:
+                size = path.stat().st_size
+                if not dry_run:
+                    path.unlink()
+            except FileNotFoundError:
+                # Sessions expire whether or not any chunk was written
+                continue
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f"Failed to remove {path}: {e}")
+                continue
+            reclaimed += size
+
+        verb = "Would reclaim" if dry_run else "Reclaimed"
+        self.stdout.write(
+            f"{verb} {reclaimed / (1024 * 1024):.2f} MB from {len(expired_ids)} "
+            f"expired uploads ({failed} files failed)"
+        )
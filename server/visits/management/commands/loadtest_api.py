@@ -0,0 +1,132 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from visits.models import Visit
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how many concurrent connections a running API deployment "
+        "sustains. Pass one --target per deployment to compare them, e.g. "
+        "--target wsgi=http://localhost:8000 --target asgi=http://localhost:8001"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="name=base_url of a running deployment (may be repeated)",
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Path to request (may be repeated). Defaults to the async "
+            "/rest/visits/{id}/status of the newest visit, and the sync "
+            "/rest/health/live for comparison",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            action="append",
+            help="Number of concurrent connections (may be repeated)",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10, help="Seconds per run"
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=10, help="Per request timeout"
+        )
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options["target"]:
+            name, _, url = target.partition("=")
+            if not url:
+                raise CommandError(f"--target must be name=url, got {target}")
+            targets.append((name, url))
+
+        paths = options["path"]
+        if not paths:
+            visit = Visit.objects.order_by("-id").only("id").first()
+            if visit is None:
+                raise CommandError("No visits to load test, create one or pass --path")
+            paths = [f"/rest/visits/{visit.id}/status", "/rest/health/live"]
+
+        levels = options["concurrency"] or [10, 50, 200]
+        self.stdout.write(
+            f"{'target':<10}{'path':<28}{'conns':>7}{'req/s':>10}{'ok':>9}"
+            f"{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}"
+        )
+        for name, url in targets:
+            for path in paths:
+                for concurrency in levels:
+                    result = asyncio.run(
+                        run_load(
+                            url,
+                            path,
+                            concurrency,
+                            options["duration"],
+                            options["timeout"],
+                        )
+                    )
+                    self.stdout.write(
+                        f"{name:<10}{path:<28}{concurrency:>7}{result['rps']:>10.1f}"
+                        f"{result['ok']:>9}{result['errors']:>8}"
+                        f"{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                    )
+
+
+async def _request(host: str, port: int, path: str, timeout: float) -> bool:
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout
+    )
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode()
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return response.startswith((b"HTTP/1.1 2", b"HTTP/1.0 2"))
+    finally:
+        writer.close()
+
+
+async def run_load(
+    base_url: str, path: str, concurrency: int, duration: float, timeout: float
+) -> dict:
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start_time = time.monotonic()
+            try:
+                ok = await _request(host, port, path, timeout)
+            except (OSError, TimeoutError):
+                ok = False
+            if ok:
+                latencies.append(time.monotonic() - start_time)
+            else:
+                errors += 1
+
+    start_time = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - start_time
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "ok": len(latencies),
+        "errors": errors,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+    }
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:00
+# ruff: noqa: RUF012
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0002_alter_visit_draft_soap_note_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='audio_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:04
+# ruff: noqa: RUF012
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0003_visit_audio_sha256'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['updated_at', 'id'], name='visit_updated_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 00:04
+# ruff: noqa: RUF012
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0004_visit_updated_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['created_at', 'id'], name='visit_created_at_id_idx'),
+        ),
+    ]
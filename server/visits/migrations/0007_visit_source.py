@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 01:24
+# ruff: noqa: RUF012
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visits', '0006_audio_blob_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='source',
+            field=models.CharField(choices=[('api', 'API'), ('backfill', 'Backfill')], default='api', max_length=20),
+        ),
+    ]
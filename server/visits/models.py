@@ -1,17 +1,81 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
 
+class AudioBlob(models.Model):
+    """Audio content stored once under its SHA-256, shared by duplicate uploads."""
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="audio/blobs/")
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"AudioBlob {self.sha256}"
+
+
 class Visit(models.Model):
+    SOURCE_CHOICES = (
+        ("api", "API"),
+        ("backfill", "Backfill"),
+    )
+
     audio_file = models.FileField(upload_to="audio/", null=True, blank=True)
+    audio_sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    audio_blob = models.ForeignKey(
+        AudioBlob,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="visits",
+    )
     transcript_text = models.TextField(null=True, blank=True)
     transcript_json = models.JSONField(null=True, blank=True)
     draft_soap_note = models.JSONField(null=True, blank=True)
     final_soap_note = models.JSONField(null=True, blank=True)
     # doctor_id = models.IntegerField(null=True, blank=True)  # these will be foreign key fields once we have Doctor and Patient models
     # patient_id = models.IntegerField(null=True, blank=True)
+    # How the visit was created; the backfill only resumes its own visits
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default="api")
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = (
+            # Keyset pagination of the visit listing
+            models.Index(fields=["created_at", "id"], name="visit_created_at_id_idx"),
+            # Keyset pagination of the feedback export
+            models.Index(fields=["updated_at", "id"], name="visit_updated_at_id_idx"),
+        )
+
     def __str__(self):
         return f"Visit {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload of a visit's audio."""
+
+    STATUS_CHOICES = (
+        ("uploading", "Uploading"),
+        ("completed", "Completed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    visit = models.ForeignKey(
+        Visit, on_delete=models.CASCADE, related_name="upload_sessions"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    # Sorted, merged [start, end) byte ranges received so far
+    received = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default="uploading"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"UploadSession {self.id} for Visit {self.visit_id}"
@@ -0,0 +1,21 @@
+import base64
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp: datetime, visit_id: int) -> str:
+    """Opaque keyset cursor for a (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{visit_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, visit_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(visit_id)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
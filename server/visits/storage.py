@@ -0,0 +1,88 @@
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+
+from .models import AudioBlob, Visit
+
+BLOB_DIR = os.path.join("audio", "blobs")
+PART_DIR = os.path.join("audio", "uploads")
+
+
+def sha256_file(path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def part_path(name: str) -> str:
+    """Local path of a partially received upload."""
+    # TODO: Write to some object store
+    path = default_storage.path(os.path.join(PART_DIR, f"{name}.part"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def store_blob(src_path: str, sha256: str, filename: str, move: bool = False):
+    """
+    Store audio content under its hash, returning `(blob, created)`.
+
+    If a blob with the same content already exists it is reused and the
+    source is not stored again. With `move=True` the source file is consumed.
+    """
+    blob = AudioBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        ext = os.path.splitext(filename)[1].lower()
+        name = os.path.join(BLOB_DIR, sha256[:2], f"{sha256}{ext}")
+        dest = default_storage.path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        size = os.path.getsize(src_path)
+
+        # Write next to the destination first so readers never see a
+        # partially copied blob
+        tmp_dest = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+        if move:
+            shutil.move(src_path, tmp_dest)
+        else:
+            shutil.copyfile(src_path, tmp_dest)
+        os.replace(tmp_dest, dest)
+
+        try:
+            with transaction.atomic():
+                blob = AudioBlob.objects.create(sha256=sha256, file=name, size=size)
+            return blob, True
+        except IntegrityError:
+            # Stored concurrently by another upload of the same content
+            blob = AudioBlob.objects.get(sha256=sha256)
+
+    if move and os.path.exists(src_path):
+        os.remove(src_path)
+    return blob, False
+
+
+def write_uploaded_file(file) -> tuple[str, str]:
+    """
+    Write an uploaded file to a temporary part, hashing it on the way.
+
+    Returns `(path, sha256)`. No database access, so it can run off the
+    event loop in any thread.
+    """
+    path = part_path(uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    with open(path, "wb") as destination:
+        for chunk in file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+    return path, digest.hexdigest()
+
+
+def link_blob(visit: Visit, blob: AudioBlob):
+    visit.audio_blob = blob
+    visit.audio_file = blob.file.name
+    visit.audio_sha256 = blob.sha256
+    visit.save(update_fields=["audio_blob", "audio_file", "audio_sha256", "updated_at"])
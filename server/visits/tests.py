@@ -1,3 +1,525 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from transcribe.models import PipelineState
+from transcribe.timeline import index_sentence_times
+from visits.exports import iter_feedback_records
+from visits.models import AudioBlob, UploadSession, Visit
+from visits.pagination import encode_cursor
+from visits.storage import link_blob, part_path, store_blob
+from visits.testing import TempMediaRootMixin
+from visits.uploads import finalize_upload, hash_part
+
+
+class VisitListTests(TestCase):
+    VISIT_COUNT = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Visit.objects.bulk_create(
+            [
+                Visit(created_at=now - timedelta(minutes=i))
+                for i in range(cls.VISIT_COUNT)
+            ],
+            batch_size=5000,
+        )
+        # The oldest visits have finished the pipeline, the rest are mid-way
+        visit_ids = Visit.objects.order_by("created_at").values_list("id", flat=True)
+        PipelineState.objects.bulk_create(
+            [
+                PipelineState(
+                    visit_id=visit_id,
+                    status="completed" if i < 50 else "transcription_complete",
+                )
+                for i, visit_id in enumerate(visit_ids)
+            ],
+            batch_size=5000,
+        )
+
+    def _get(self, **params):
+        with self.assertNumQueries(1) as queries:
+            response = self.client.get("/rest/visits", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), queries.captured_queries[0]["sql"]
+
+    def _query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertWalksVisitIndex(self, sql, access):
+        plan = self._query_plan(sql)
+        self.assertIn(
+            f"{access} visits_visit USING INDEX visit_created_at_id_idx", plan[0]
+        )
+        # Rows come out of the index already ordered, no sort of the table
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_first_page_walks_the_index(self):
+        data, sql = self._get(page_size=50)
+
+        self.assertWalksVisitIndex(sql, "SCAN")
+        self.assertEqual(len(data["visits"]), 50)
+        self.assertIsNotNone(data["next_cursor"])
+        self.assertEqual(
+            set(data["visits"][0]),
+            {"id", "audio_file", "status", "finalized", "created_at", "updated_at"},
+        )
+
+    def test_deep_cursor_page_seeks_into_the_index(self):
+        # Jump close to the end of the table, as a dashboard would after
+        # paging for a while
+        visit = Visit.objects.order_by("created_at", "id")[100]
+
+        data, sql = self._get(
+            cursor=encode_cursor(visit.created_at, visit.id), page_size=50
+        )
+
+        self.assertWalksVisitIndex(sql, "SEARCH")
+        self.assertEqual(len(data["visits"]), 50)
+        self.assertTrue(all(v["id"] != visit.id for v in data["visits"]))
+
+    def test_pages_do_not_overlap(self):
+        first, _ = self._get(page_size=100)
+        second, _ = self._get(page_size=100, cursor=first["next_cursor"])
+
+        first_ids = [v["id"] for v in first["visits"]]
+        second_ids = [v["id"] for v in second["visits"]]
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertGreater(
+            first["visits"][-1]["created_at"], second["visits"][0]["created_at"]
+        )
+
+    def test_filter_by_status(self):
+        data, sql = self._get(status="completed", page_size=200)
+
+        # Only the matching pipeline states are read, not every visit
+        self.assertTrue(
+            self._query_plan(sql)[0].startswith(
+                "SEARCH transcribe_pipelinestate USING INDEX "
+                "transcribe_pipelinestate_status"
+            )
+        )
+        self.assertEqual(len(data["visits"]), 50)
+        self.assertIsNone(data["next_cursor"])
+        self.assertTrue(all(v["status"] == "completed" for v in data["visits"]))
+
+    def test_filter_by_date(self):
+        # A whole day in the middle of the data, whatever time the test runs
+        day = (timezone.now() - timedelta(days=3)).date()
+        expected = Visit.objects.filter(created_at__date=day).count()
+
+        visits, cursor = [], None
+        while True:
+            params = {"date_from": day.isoformat(), "date_to": day.isoformat()}
+            if cursor:
+                params["cursor"] = cursor
+            data, sql = self._get(page_size=200, **params)
+            visits.extend(data["visits"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertWalksVisitIndex(sql, "SEARCH")
+        self.assertGreater(expected, 0)
+        self.assertEqual(len(visits), expected)
+        self.assertTrue(all(v["created_at"][:10] == day.isoformat() for v in visits))
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/rest/visits", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=1024)
+class ResumableUploadTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("api.routes_handler.uploads_handler.transcribe_audio")
+        self.transcribe_audio = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.audio = bytes(range(256)) * 10
+        self.sha256 = hashlib.sha256(self.audio).hexdigest()
+
+    def _initiate(self, visit):
+        return self.client.post(
+            f"/rest/visits/{visit.id}/uploads",
+            {"filename": "visit.webm", "size": len(self.audio), "sha256": self.sha256},
+            content_type="application/json",
+        )
+
+    def _put(self, upload_id, start, end, checksum=None):
+        chunk = self.audio[start:end]
+        return self.client.put(
+            f"/rest/uploads/{upload_id}",
+            chunk,
+            content_type="application/octet-stream",
+            headers={
+                "Content-Range": f"bytes {start}-{end - 1}/{len(self.audio)}",
+                "X-Chunk-SHA256": checksum or hashlib.sha256(chunk).hexdigest(),
+            },
+        )
+
+    def test_out_of_order_chunks_resume_and_finalize(self):
+        visit = Visit.objects.create()
+        upload_id = self._initiate(visit).json()["upload_id"]
+
+        self.assertEqual(self._put(upload_id, 1024, 2048).status_code, 200)
+        self.assertEqual(self._put(upload_id, 2048, 2560).status_code, 200)
+        # Resuming client asks what is missing
+        status = self.client.get(f"/rest/uploads/{upload_id}").json()
+        self.assertEqual(status["received"], [[1024, 2560]])
+
+        self._put(upload_id, 0, 1024)
+        response = self.client.post(f"/rest/uploads/{upload_id}/finalize")
+
+        self.assertEqual(response.status_code, 200)
+        visit.refresh_from_db()
+        self.assertEqual(visit.audio_sha256, self.sha256)
+        with visit.audio_file.open("rb") as f:
+            self.assertEqual(f.read(), self.audio)
+        self.transcribe_audio.assert_called_once()
+
+    def test_chunk_checksum_mismatch_is_rejected(self):
+        upload_id = self._initiate(Visit.objects.create()).json()["upload_id"]
+
+        response = self._put(upload_id, 0, 1024, checksum="0" * 64)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).received, [])
+
+    def test_finalize_requires_every_byte(self):
+        upload_id = self._initiate(Visit.objects.create()).json()["upload_id"]
+        self._put(upload_id, 0, 1024)
+
+        response = self.client.post(f"/rest/uploads/{upload_id}/finalize")
+
+        self.assertEqual(response.status_code, 409)
+
+    def _upload_all(self, visit):
+        upload_id = self._initiate(visit).json()["upload_id"]
+        for start in range(0, len(self.audio), 1024):
+            self._put(upload_id, start, min(start + 1024, len(self.audio)))
+        return self.client.post(f"/rest/uploads/{upload_id}/finalize").json()
+
+    def test_duplicate_upload_is_stored_once(self):
+        first = Visit.objects.create()
+        self.assertFalse(self._upload_all(first)["deduplicated"])
+
+        second = Visit.objects.create()
+        data = self._upload_all(second)
+
+        self.assertTrue(data["deduplicated"])
+        second.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual(AudioBlob.objects.count(), 1)
+        self.assertEqual(second.audio_file.name, first.audio_file.name)
+        self.assertEqual(self.transcribe_audio.call_count, 2)
+
+    def test_declared_hash_alone_does_not_link_existing_audio(self):
+        self._upload_all(Visit.objects.create())
+        other = Visit.objects.create()
+
+        # Knowing the hash of stored audio must not grant access to it
+        data = self._initiate(other).json()
+
+        self.assertEqual(data["status"], "uploading")
+        self.assertEqual(data["received"], [])
+        other.refresh_from_db()
+        self.assertIsNone(other.audio_blob)
+        self.assertIsNone(other.audio_sha256)
+        self.assertEqual(self.transcribe_audio.call_count, 1)
+
+    def test_retried_finalize_transcribes_once(self):
+        visit = Visit.objects.create()
+        upload_id = self._initiate(visit).json()["upload_id"]
+        for start in range(0, len(self.audio), 1024):
+            self._put(upload_id, start, min(start + 1024, len(self.audio)))
+
+        first = self.client.post(f"/rest/uploads/{upload_id}/finalize")
+        retry = self.client.post(f"/rest/uploads/{upload_id}/finalize")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["status"], "completed")
+        self.transcribe_audio.assert_called_once()
+
+    def test_finalize_racing_a_completed_upload_does_not_finalize_again(self):
+        visit = Visit.objects.create()
+        upload_id = self._initiate(visit).json()["upload_id"]
+        for start in range(0, len(self.audio), 1024):
+            self._put(upload_id, start, min(start + 1024, len(self.audio)))
+        # Both requests read the session before either finalized it
+        stale = UploadSession.objects.get(id=upload_id)
+        file_sha256 = hash_part(stale)
+        self.client.post(f"/rest/uploads/{upload_id}/finalize")
+
+        self.assertIsNone(hash_part(stale))
+        blob, deduplicated, finalized = finalize_upload(stale, file_sha256)
+
+        self.assertFalse(finalized)
+        self.assertFalse(deduplicated)
+        self.assertEqual(blob.sha256, self.sha256)
+        self.assertEqual(stale.status, "completed")
+        self.assertEqual(AudioBlob.objects.count(), 1)
+
+    def test_gc_removes_abandoned_uploads(self):
+        visit = Visit.objects.create()
+        abandoned = self._initiate(visit).json()["upload_id"]
+        active = self._initiate(visit).json()["upload_id"]
+        self._put(abandoned, 0, 1024)
+        self._put(active, 0, 1024)
+        UploadSession.objects.filter(id=abandoned).update(
+            updated_at=timezone.now() - timedelta(hours=25)
+        )
+        orphan = part_path("orphan")
+        with open(orphan, "wb") as f:
+            f.write(b"x")
+        old = time.time() - 25 * 60 * 60
+        os.utime(orphan, (old, old))
+
+        out = io.StringIO()
+        call_command("gc_uploads", "--dry-run", stdout=out)
+        self.assertIn(f"{abandoned}: upload expired", out.getvalue())
+        self.assertIn("orphan.part: orphaned part", out.getvalue())
+        self.assertTrue(os.path.exists(orphan))
+
+        call_command("gc_uploads", stdout=io.StringIO())
+
+        self.assertFalse(UploadSession.objects.filter(id=abandoned).exists())
+        self.assertFalse(os.path.exists(part_path(abandoned)))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(part_path(active)))
+        self.assertEqual(self.client.get(f"/rest/uploads/{active}").status_code, 200)
+
+
+class AudioPlaybackTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.audio = bytes(range(256)) * 40
+        self.sha256 = hashlib.sha256(self.audio).hexdigest()
+        src = os.path.join(self.media_root, "visit.webm")
+        with open(src, "wb") as f:
+            f.write(self.audio)
+        blob, _ = store_blob(src, self.sha256, "visit.webm", move=True)
+
+        self.visit = Visit.objects.create(
+            transcript_json={
+                "sentences": [
+                    {
+                        "sentence_id": i,
+                        "sentence": text,
+                        "start": start,
+                        "end": end,
+                        "speaker": i % 2,
+                    }
+                    for i, (text, start, end) in enumerate(
+                        [
+                            ("Hi.", 0.0, 2.5),
+                            ("It hurts.", 2.5, 7.5),
+                            ("Since when?", 7.5, 10.0),
+                        ]
+                    )
+                ]
+            }
+        )
+        link_blob(self.visit, blob)
+        index_sentence_times(self.visit)
+        self.url = f"/rest/visits/{self.visit.id}/audio"
+
+    def _body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_full_response_advertises_ranges(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], f'"{self.sha256}"')
+        self.assertEqual(response["Content-Type"], "audio/webm")
+        self.assertEqual(self._body(response), self.audio)
+
+    def test_range_request_returns_partial_content(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, headers={"Range": "bytes=100-199"})
+        self.assertEqual(len(queries), 1)
+        self._assert_no_transcript_loaded(queries)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.audio)}")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(self._body(response), self.audio[100:200])
+
+        suffix = self.client.get(self.url, headers={"Range": "bytes=-10"})
+        self.assertEqual(self._body(suffix), self.audio[-10:])
+
+    async def test_asgi_streams_with_async_iterator(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Length"], str(len(self.audio)))
+        self.assertEqual(b"".join([c async for c in response]), self.audio)
+
+        response = await self.async_client.get(
+            self.url, headers={"Range": "bytes=100-199"}
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(b"".join([c async for c in response]), self.audio[100:200])
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(
+            self.url, headers={"Range": f"bytes={len(self.audio)}-"}
+        )
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.audio)}")
+
+    def test_conditional_and_versioned_caching(self):
+        response = self.client.get(
+            self.url, headers={"If-None-Match": f'"{self.sha256}"'}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        details = self.client.get(f"/rest/visits/{self.visit.id}").json()
+        response = self.client.get(details["visit"]["audio_url"])
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(
+            self.client.get(self.url)["Cache-Control"], "private, no-cache"
+        )
+
+    def _assert_no_transcript_loaded(self, queries):
+        for query in queries.captured_queries:
+            for column in ("transcript_json", "draft_soap_note", "final_soap_note"):
+                self.assertNotIn(column, query["sql"])
+
+    def test_references_resolve_without_transcript(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/rest/visits/{self.visit.id}/references", {"sentence_ids": "1"}
+            )
+
+        # Visit with its blob, the recording length, the sentences
+        self.assertEqual(len(queries), 3)
+        self._assert_no_transcript_loaded(queries)
+
+        self.assertEqual(response.status_code, 200)
+        [reference] = response.json()["references"]
+        self.assertEqual(reference["start"], 2.5)
+        self.assertEqual(reference["end"], 7.5)
+        self.assertEqual(reference["speaker"], "1")
+        # A quarter to three quarters of a constant bitrate recording
+        self.assertEqual(reference["bytes"], {"start": 2560, "end": 7680})
+
+    def test_references_reject_bad_ids(self):
+        response = self.client.get(
+            f"/rest/visits/{self.visit.id}/references", {"sentence_ids": "a,b"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class FeedbackExportTests(TestCase):
+    def setUp(self):
+        draft = {"plan": {"text": "Rest", "references": []}}
+        self.visits = [
+            Visit.objects.create(
+                draft_soap_note=draft, final_soap_note={"plan": "Rest"}
+            )
+            for _ in range(5)
+        ]
+        # Not finalized, never exported
+        Visit.objects.create(draft_soap_note=draft)
+        # Saved in the same instant, so batches split inside one updated_at
+        self.updated_at = timezone.now()
+        Visit.objects.filter(final_soap_note__isnull=False).update(
+            updated_at=self.updated_at
+        )
+        staff = User.objects.create(username="admin", is_staff=True)
+        self.client.force_login(staff)
+        self.async_client.force_login(staff)
+
+    def test_batches_with_equal_updated_at_neither_skip_nor_repeat(self):
+        records = list(iter_feedback_records(batch_size=2))
+
+        self.assertEqual([r["visit_id"] for r in records], [v.id for v in self.visits])
+
+    def test_resumes_after_cursor(self):
+        records = list(iter_feedback_records(batch_size=2))
+
+        resumed = list(iter_feedback_records(records[2]["cursor"], batch_size=2))
+
+        self.assertEqual(
+            [r["visit_id"] for r in resumed], [v.id for v in self.visits[3:]]
+        )
+        self.assertEqual(list(iter_feedback_records(records[-1]["cursor"])), [])
+
+    def test_endpoint_streams_ndjson(self):
+        response = self.client.get("/rest/exports/soap_feedback")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(lines), 5)
+        record = json.loads(lines[0])
+        self.assertFalse(record["sections"]["plan"]["changed"])
+        self.assertEqual(record["sections"]["subjective"]["final"], "")
+
+    async def test_endpoint_streams_without_buffering_under_asgi(self):
+        response = await self.async_client.get("/rest/exports/soap_feedback")
+
+        # A sync iterator would be collected into a list before sending
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(len(lines), 5)
+
+    def test_endpoint_requires_staff(self):
+        self.client.logout()
+        self.assertEqual(
+            self.client.get("/rest/exports/soap_feedback").status_code, 403
+        )
+
+        self.client.force_login(User.objects.create(username="clinician"))
+        self.assertEqual(
+            self.client.get("/rest/exports/soap_feedback").status_code, 403
+        )
+
+    def test_command_writes_to_stdout_or_file(self):
+        out = io.StringIO()
+        call_command("export_soap_feedback", stdout=out, stderr=io.StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "feedback.ndjson")
+            cursor_file = os.path.join(directory, "cursor")
+            call_command(
+                "export_soap_feedback",
+                "--output",
+                output,
+                "--cursor-file",
+                cursor_file,
+                stderr=io.StringIO(),
+            )
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+            with open(cursor_file) as f:
+                self.assertEqual(f.read(), records[-1]["cursor"])
+        self.assertEqual(len(records), 5)
+
+    def test_endpoint_rejects_bad_cursor(self):
+        response = self.client.get(
+            "/rest/exports/soap_feedback", {"cursor": "not-a-cursor"}
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AudioBlob, UploadSession, Visit
+from .storage import link_blob, part_path, sha256_file, store_blob
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _merge_range(ranges: list, start: int, end: int) -> list:
+    merged = []
+    for range_start, range_end in sorted([*ranges, [start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def parse_content_range(header: str | None) -> tuple[int, int, int]:
+    """Parse `bytes start-end/total` into a [start, end) range and total size."""
+    match = CONTENT_RANGE_RE.match(header or "")
+    if not match:
+        raise UploadError("Content-Range header must be 'bytes start-end/total'")
+    start, last, total = (int(group) for group in match.groups())
+    if last < start:
+        raise UploadError("Invalid Content-Range")
+    return start, last + 1, total
+
+
+def initiate_upload(visit: Visit, filename: str, size: int, sha256: str):
+    """
+    Start a resumable upload.
+
+    The declared hash is only checked against the received bytes; identical
+    audio is deduplicated in `finalize_upload`, once the server has hashed
+    the file itself.
+    """
+    sha256 = sha256.lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        raise UploadError("sha256 must be a hex encoded SHA-256 digest")
+    if size <= 0:
+        raise UploadError("size must be positive")
+
+    return UploadSession.objects.create(
+        visit=visit, filename=filename, size=size, sha256=sha256
+    )
+
+
+def validate_chunk(
+    session: UploadSession,
+    content_range: str | None,
+    data: bytes,
+    chunk_sha256: str | None,
+) -> tuple[int, int]:
+    """Check a chunk against its Content-Range and checksum, returning [start, end)."""
+    if session.status != "uploading":
+        raise UploadError("Upload is already finalized", status=409)
+    start, end, total = parse_content_range(content_range)
+    if total != session.size or end > session.size:
+        raise UploadError("Content-Range does not match the upload size")
+    if len(data) != end - start:
+        raise UploadError("Body length does not match Content-Range")
+    if len(data) > settings.UPLOAD_CHUNK_SIZE:
+        raise UploadError(
+            f"Chunks may be at most {settings.UPLOAD_CHUNK_SIZE} bytes", status=413
+        )
+    if not chunk_sha256:
+        raise UploadError("X-Chunk-SHA256 header is required")
+    if hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+        raise UploadError("Chunk checksum mismatch", status=422)
+    return start, end
+
+
+def write_part(session_id, start: int, data: bytes):
+    """Write a verified chunk into the partial upload file. No database access."""
+    # Chunks may arrive concurrently and out of order: never truncate
+    fd = os.open(part_path(str(session_id)), os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+b") as f:
+        f.seek(start)
+        f.write(data)
+
+
+def record_range(session_id, start: int, end: int) -> UploadSession:
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session_id)
+        session.received = _merge_range(session.received, start, end)
+        session.save(update_fields=["received", "updated_at"])
+    return session
+
+
+def finalize_upload(
+    session: UploadSession, file_sha256: str | None = None
+) -> tuple[AudioBlob, bool, bool]:
+    """
+    Verify and store a fully received upload.
+
+    Returns `(blob, deduplicated, finalized)`. Of concurrent or retried
+    calls only one finalizes the upload and gets `finalized=True`; the
+    others return the stored blob. When the same audio is already stored
+    the visit is linked to the existing blob and the uploaded copy is
+    discarded. Pass `file_sha256` when the part file has already been
+    hashed (see `hash_part`).
+    """
+    mismatch = False
+    with transaction.atomic():
+        # Writing first takes the lock right away, also on SQLite where
+        # select_for_update is a no-op, so the status check below is
+        # serialized with any other finalize of this upload
+        UploadSession.objects.filter(id=session.id).update(updated_at=timezone.now())
+        locked = (
+            UploadSession.objects.select_for_update()
+            .select_related("visit__audio_blob")
+            .get(id=session.id)
+        )
+        session.status, session.received = locked.status, locked.received
+        if locked.status == "completed":
+            return locked.visit.audio_blob, False, False
+        if locked.received != [[0, locked.size]]:
+            raise UploadError("Upload is incomplete", status=409)
+
+        path = part_path(str(locked.id))
+        if (file_sha256 or sha256_file(path)) != locked.sha256:
+            # Start over rather than keep bytes we cannot trust
+            os.remove(path)
+            locked.received = session.received = []
+            locked.save(update_fields=["received", "updated_at"])
+            mismatch = True
+        else:
+            blob, created = store_blob(path, locked.sha256, locked.filename, move=True)
+            link_blob(locked.visit, blob)
+            locked.status = session.status = "completed"
+            locked.save(update_fields=["status", "updated_at"])
+
+    if mismatch:
+        raise UploadError("File checksum mismatch, upload again", status=422)
+    return blob, not created, True
+
+
+def hash_part(session: UploadSession) -> str | None:
+    """Hash a fully received upload. No database access."""
+    if session.status == "completed" or session.received != [[0, session.size]]:
+        return None
+    try:
+        return sha256_file(part_path(str(session.id)))
+    except FileNotFoundError:
+        # Finalized concurrently, the part has been moved into storage
+        return None
+
+
+def serialize_session(session: UploadSession, blob: AudioBlob | None = None) -> dict:
+    return {
+        "upload_id": str(session.id),
+        "visit_id": session.visit_id,
+        "status": session.status,
+        "size": session.size,
+        "received": session.received,
+        "chunk_size": settings.UPLOAD_CHUNK_SIZE,
+        "file_path": blob.file.name if blob else None,
+    }